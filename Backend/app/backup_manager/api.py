@@ -1,3 +1,5 @@
+import os
+
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
@@ -27,9 +29,9 @@ async def run_device_backup(
     except (RuntimeError, FileNotFoundError) as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    return schemas.BackupRunResponse(
-        records=[schemas.BackupRecordResponse.from_orm(record) for record in records]
-    )
+    # model_validate обходит весь батч одним вызовом pydantic-core вместо
+    # легаси from_orm на каждую запись.
+    return schemas.BackupRunResponse.model_validate({"records": records})
 
 
 @router.post("/{backup_id}/restore", response_model=schemas.BackupRecordResponse)
@@ -48,24 +50,32 @@ async def restore_backup(
     except RuntimeError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    return schemas.BackupRecordResponse.from_orm(record)
+    return schemas.BackupRecordResponse.model_validate(record)
 
 
+# Синхронный handler: внутри только запрос к БД и os.stat/isfile, await нет.
+# Обычный def уводит его в threadpool Starlette и не блокирует event loop.
 @router.get("/{backup_id}/download")
-async def download_backup(
+def download_backup(
     backup_id: int,
     db: Session = Depends(get_db),
 ):
     backup_service = service.BackupService(db)
     try:
-        record = await backup_service.get_backup_file(backup_id)
+        record = backup_service.get_backup_file(backup_id)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
     except FileNotFoundError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
 
+    # Делаем stat один раз и передаем его в FileResponse: ответ сразу получает
+    # Content-Length без повторного stat, а отдача файла уходит через sendfile
+    # (zero-copy), не блокируя event loop на чтении крупных .backup/.rsc файлов.
+    stat_result = os.stat(record.storage_path)
+
     return FileResponse(
         path=record.storage_path,
         filename=record.filename,
         media_type="application/octet-stream",
+        stat_result=stat_result,
     )
@@ -1,4 +1,5 @@
 from typing import Optional, List
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from backup_manager import models
 
@@ -14,15 +15,20 @@ class BackupCRUD:
         filename: str,
         storage_path: str,
     ) -> models.BackupRecord:
-        record = models.BackupRecord(
-            device_id=device_id,
-            backup_type=backup_type,
-            filename=filename,
-            storage_path=storage_path,
+        # INSERT ... RETURNING возвращает строку сразу, без отдельного SELECT
+        # на refresh — одна поездка в БД вместо двух.
+        stmt = (
+            insert(models.BackupRecord)
+            .values(
+                device_id=device_id,
+                backup_type=backup_type,
+                filename=filename,
+                storage_path=storage_path,
+            )
+            .returning(models.BackupRecord)
         )
-        self.db.add(record)
+        record = self.db.execute(stmt).scalar_one()
         self.db.commit()
-        self.db.refresh(record)
         return record
 
     def get_backup_record(self, backup_id: int) -> Optional[models.BackupRecord]:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, Text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from db import Base
@@ -7,8 +7,14 @@ from db import Base
 class BackupRecord(Base):
     __tablename__ = "backup_records"
 
+    # Составной индекс под горячий запрос list_device_backups:
+    # фильтр по device_id + сортировка по created_at без отдельного sort.
+    __table_args__ = (
+        Index("ix_backup_records_device_created", "device_id", "created_at"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
-    device_id = Column(Integer, ForeignKey("devices.id"), nullable=False, index=True)
+    device_id = Column(Integer, ForeignKey("devices.id"), nullable=False)
     backup_type = Column(String(20), nullable=False)
     filename = Column(String(255), nullable=False)
     storage_path = Column(Text, nullable=False)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Literal, List
 from datetime import datetime
 
@@ -8,6 +8,8 @@ class BackupRunRequest(BaseModel):
 
 
 class BackupRecordResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     device_id: int
     backup_type: str
@@ -15,9 +17,6 @@ class BackupRecordResponse(BaseModel):
     storage_path: str
     created_at: datetime
 
-    class Config:
-        from_attributes = True
-
 
 class BackupRestoreRequest(BaseModel):
     confirm: bool = Field(False, description="Подтверждение восстановления")
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import re
 from datetime import datetime
@@ -10,6 +11,14 @@ from backup_manager import crud
 from device_manager import crud as device_crud
 from mikrotik_connector import MikroTikConnector
 
+# Компилируем паттерн один раз на модуль: _sanitize_name вызывается на каждый
+# бэкап, и повторный поиск в кэше re на горячем пути ни к чему.
+_SANITIZE_RE = re.compile(r"[^a-zA-Z0-9_-]+")
+
+# Каталоги устройств, уже созданные в этом процессе: после первого makedirs
+# горячий путь обходится без лишнего syscall.
+_created_device_dirs: set = set()
+
 
 class BackupService:
     def __init__(self, db: Session, storage_root: str = "/storage/backups"):
@@ -19,31 +28,35 @@ class BackupService:
         self.device_crud = device_crud.DeviceCRUD(db)
 
     def _sanitize_name(self, name: str) -> str:
-        return re.sub(r"[^a-zA-Z0-9_-]+", "_", name).strip("_") or "device"
+        return _SANITIZE_RE.sub("_", name).strip("_") or "device"
+
+    def _make_timestamp(self) -> str:
+        return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
 
-    def _build_paths(self, device_id: int, device_name: str, backup_type: str):
-        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    def _build_paths(self, device_id: int, device_name: str, backup_type: str, timestamp: str = None):
+        # Общий timestamp для бандла передается снаружи: оба артефакта "both"
+        # получают одинаковую метку и легко сопоставляются.
+        if timestamp is None:
+            timestamp = self._make_timestamp()
         safe_name = self._sanitize_name(device_name)
         base_name = f"{safe_name}_{device_id}_{timestamp}_{backup_type}"
         ext = "backup" if backup_type == "backup" else "rsc"
         filename = f"{base_name}.{ext}"
         device_dir = os.path.join(self.storage_root, f"device_{device_id}")
-        os.makedirs(device_dir, exist_ok=True)
+        if device_dir not in _created_device_dirs:
+            os.makedirs(device_dir, exist_ok=True)
+            _created_device_dirs.add(device_dir)
         storage_path = os.path.join(device_dir, filename)
         return base_name, filename, storage_path
 
-    async def run_backup(self, device_id: int, backup_type: str):
+    def _get_device_data(self, device_id: int):
         device_data = self.device_crud.get_device_with_password(device_id)
         if not device_data:
             raise ValueError("Device not found")
+        return device_data
 
-        base_name, filename, storage_path = self._build_paths(
-            device_id=device_id,
-            device_name=device_data["name"],
-            backup_type=backup_type,
-        )
-
-        connector = MikroTikConnector(
+    def _build_connector(self, device_data) -> MikroTikConnector:
+        return MikroTikConnector(
             host=device_data["host"],
             username=device_data["username"],
             password=device_data["password"],
@@ -52,46 +65,84 @@ class BackupService:
             use_ssl=device_data["use_ssl"],
         )
 
-        try:
-            await connector.connect()
+    async def _run_backup_on_connector(
+        self,
+        connector: MikroTikConnector,
+        device_id: int,
+        device_name: str,
+        backup_type: str,
+        timestamp: str = None,
+    ):
+        """Выполнение одного бэкапа на уже подключенном коннекторе."""
+        if not connector.ssh_client or not connector.sftp_client:
+            raise RuntimeError("SSH/SFTP connection required for backup")
 
-            if not connector.ssh_client or not connector.sftp_client:
-                raise RuntimeError("SSH/SFTP connection required for backup")
-
-            if backup_type == "backup":
-                command = f"/system/backup/save name={base_name}"
-                remote_file = f"{base_name}.backup"
-            elif backup_type == "export":
-                command = f"/export file={base_name}"
-                remote_file = f"{base_name}.rsc"
-            else:
-                raise ValueError("Unsupported backup type")
+        base_name, filename, storage_path = self._build_paths(
+            device_id=device_id,
+            device_name=device_name,
+            backup_type=backup_type,
+            timestamp=timestamp,
+        )
 
-            connector.run_ssh_command(command)
-            connector.download_file(remote_file, storage_path)
+        if backup_type == "backup":
+            command = f"/system/backup/save name={base_name}"
+            remote_file = f"{base_name}.backup"
+        elif backup_type == "export":
+            command = f"/export file={base_name}"
+            remote_file = f"{base_name}.rsc"
+        else:
+            raise ValueError("Unsupported backup type")
 
-            record = self.backup_crud.create_backup_record(
-                device_id=device_id,
-                backup_type=backup_type,
-                filename=filename,
-                storage_path=storage_path,
-            )
+        connector.run_ssh_command(command)
+        connector.download_file(remote_file, storage_path)
 
-            self.device_crud.update_last_backup(device_id, func.now())
+        record = self.backup_crud.create_backup_record(
+            device_id=device_id,
+            backup_type=backup_type,
+            filename=filename,
+            storage_path=storage_path,
+        )
 
-            return record
+        self.device_crud.update_last_backup(device_id, func.now())
+        self.db.commit()
+
+        return record
+
+    async def run_backup(self, device_id: int, backup_type: str):
+        device_data = self._get_device_data(device_id)
+        connector = self._build_connector(device_data)
+
+        try:
+            await connector.connect()
+            return await self._run_backup_on_connector(
+                connector, device_id, device_data["name"], backup_type
+            )
         finally:
             await connector.disconnect()
 
     async def run_backup_bundle(self, device_id: int, backup_type: str) -> List:
-        types = [backup_type]
-        if backup_type == "both":
-            types = ["backup", "export"]
+        if backup_type != "both":
+            return [await self.run_backup(device_id, backup_type)]
+
+        # Для "both" поднимаем одно SSH/SFTP-соединение и выполняем оба типа
+        # на нем: TCP+SSH handshake — самая дорогая часть, и делать его дважды
+        # ради двух команд на одном устройстве незачем.
+        device_data = self._get_device_data(device_id)
+        connector = self._build_connector(device_data)
+
+        # Один timestamp на весь бандл: оба файла получают одинаковую метку.
+        timestamp = self._make_timestamp()
 
         records = []
-        for backup_kind in types:
-            record = await self.run_backup(device_id, backup_kind)
-            records.append(record)
+        try:
+            await connector.connect()
+            for backup_kind in ("backup", "export"):
+                record = await self._run_backup_on_connector(
+                    connector, device_id, device_data["name"], backup_kind, timestamp
+                )
+                records.append(record)
+        finally:
+            await connector.disconnect()
         return records
 
     async def restore_backup(self, backup_id: int, confirm: bool):
@@ -126,7 +177,11 @@ class BackupService:
 
             remote_filename = os.path.basename(record.storage_path)
             remote_path = remote_filename
-            connector.upload_file(record.storage_path, remote_path)
+            # Блокирующий SFTP PUT уводим в поток, чтобы не держать event loop
+            # на время загрузки многомегабайтного бэкапа.
+            await asyncio.to_thread(
+                connector.upload_file, record.storage_path, remote_path
+            )
 
             if record.backup_type == "backup":
                 base_name = remote_filename.rsplit(".backup", 1)[0]
@@ -141,7 +196,7 @@ class BackupService:
         finally:
             await connector.disconnect()
 
-    async def get_backup_file(self, backup_id: int):
+    def get_backup_file(self, backup_id: int):
         record = self.backup_crud.get_backup_record(backup_id)
         if not record:
             raise ValueError("Backup record not found")
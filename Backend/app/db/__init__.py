@@ -18,14 +18,39 @@ if not DATABASE_URL:
 
 # Создаем engine подключения; для SQLite добавляем check_same_thread=False,
 # чтобы разрешить доступ к соединению из разных потоков.
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-)
+_engine_kwargs = {"pool_pre_ping": True}
+
+if DATABASE_URL.startswith("sqlite"):
+    _engine_kwargs["connect_args"] = {"check_same_thread": False}
+else:
+    # Расширяем пул соединений: дефолтные 5 соединений сериализуют
+    # конкурентные запросы FastAPI-воркеров.
+    _engine_kwargs.update(
+        pool_size=20,
+        max_overflow=40,
+        pool_recycle=1800,
+    )
+
+if DATABASE_URL.startswith("postgresql"):
+    # Пакетный executemany для psycopg2: массовые INSERT/UPDATE уходят
+    # одним multi-VALUES statement вместо statement-на-строку.
+    _engine_kwargs.update(
+        executemany_mode="values_plus_batch",
+        executemany_batch_page_size=500,
+        insertmanyvalues_page_size=1000,
+    )
+
+engine = create_engine(DATABASE_URL, **_engine_kwargs)
 
 # SessionLocal — фабрика сессий SQLAlchemy для работы с транзакциями.
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: объекты не сбрасываются после commit, поэтому
+# сериализация ответа не перечитывает каждую строку отдельным SELECT.
+SessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    bind=engine,
+)
 # Base — базовый класс для декларативных моделей.
 Base = declarative_base()
 
@@ -36,5 +61,57 @@ def get_db():
     db = SessionLocal()
     try:
         yield db
-    finally:
+    finally:
         db.close()
+
+
+# --- Async-доступ к БД -------------------------------------------------------
+# Async-двойник engine/SessionLocal для async def-эндпоинтов: блокирующие
+# вызовы sync-сессии держат event loop, AsyncSession — нет. Создается лениво,
+# чтобы asyncpg/aiosqlite оставались опциональными зависимостями; хендлеры
+# переводятся на get_async_db по мере миграции.
+
+def _async_database_url() -> str:
+    if DATABASE_URL.startswith("postgresql+psycopg2"):
+        return DATABASE_URL.replace("postgresql+psycopg2", "postgresql+asyncpg", 1)
+    if DATABASE_URL.startswith("postgresql+asyncpg"):
+        return DATABASE_URL
+    if DATABASE_URL.startswith("postgresql"):
+        return DATABASE_URL.replace("postgresql", "postgresql+asyncpg", 1)
+    if DATABASE_URL.startswith("sqlite+aiosqlite"):
+        return DATABASE_URL
+    if DATABASE_URL.startswith("sqlite"):
+        return DATABASE_URL.replace("sqlite", "sqlite+aiosqlite", 1)
+    return DATABASE_URL
+
+
+_async_engine = None
+_async_session_factory = None
+
+
+def get_async_sessionmaker():
+    """Лениво создает async engine и фабрику AsyncSession."""
+    global _async_engine, _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        async_url = _async_database_url()
+        async_kwargs = {"pool_pre_ping": True}
+        if not async_url.startswith("sqlite"):
+            async_kwargs.update(pool_size=20, max_overflow=40, pool_recycle=1800)
+
+        _async_engine = create_async_engine(async_url, **async_kwargs)
+        _async_session_factory = async_sessionmaker(
+            _async_engine,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    return _async_session_factory
+
+
+async def get_async_db():
+    session = get_async_sessionmaker()()
+    try:
+        yield session
+    finally:
+        await session.close()
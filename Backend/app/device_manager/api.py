@@ -1,7 +1,7 @@
-# app/device_manager/api.py
+# app/device_manager/api.py
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.orm import Session
+from typing import List, Optional
 from db import get_db
 from device_manager import schemas, service, crud, models
 from security import encrypt_password
@@ -18,78 +18,76 @@ router = APIRouter(
 # Создание устройства (POST /devices).
 @router.post("/", response_model=schemas.DeviceResponse)
 def create_device(
-        device: schemas.DeviceCreate,
-        db: Session = Depends(get_db)
-):
-    """Создание нового устройства"""
-    device_crud = crud.DeviceCRUD(db)
-
-    # Проверяем уникальность имени
-    existing = db.query(models.Device).filter(
-        models.Device.name == device.name
-    ).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Device with this name already exists")
-
-    return device_crud.create_device(device)
-
-
+        device: schemas.DeviceCreate,
+        db: Session = Depends(get_db)
+):
+    """Создание нового устройства"""
+    device_crud = crud.DeviceCRUD(db)
+
+    # Уникальность имени обеспечивается атомарно на уровне INSERT ... ON CONFLICT,
+    # без отдельного SELECT-а и окна гонки.
+    created = device_crud.create_device(device)
+    if created is None:
+        raise HTTPException(status_code=400, detail="Device with this name already exists")
+    return created
+
+
 # Получение списка устройств (GET /devices) с необязательной фильтрацией по группе.
 @router.get("/", response_model=List[schemas.DeviceResponse])
 def get_devices(
-        skip: int = 0,
-        limit: int = 100,
-        group_id: Optional[int] = None,
-        db: Session = Depends(get_db)
-):
-    """Получение списка устройств"""
-    device_crud = crud.DeviceCRUD(db)
-
-    if group_id:
-        return device_crud.get_devices_by_group(group_id)
-    return device_crud.get_all_devices(skip, limit)
-
-
+        skip: int = 0,
+        limit: int = 100,
+        group_id: Optional[int] = None,
+        db: Session = Depends(get_db)
+):
+    """Получение списка устройств"""
+    device_crud = crud.DeviceCRUD(db)
+
+    if group_id:
+        return device_crud.get_devices_by_group(group_id)
+    return device_crud.get_all_devices(skip, limit)
+
+
 # Получение устройства по ID (GET /devices/{device_id}).
 @router.get("/{device_id}", response_model=schemas.DeviceResponse)
 def get_device(
-        device_id: int,
-        db: Session = Depends(get_db)
-):
-    """Получение устройства по ID"""
-    device_crud = crud.DeviceCRUD(db)
-    device = device_crud.get_device(device_id)
-    if not device:
-        raise HTTPException(status_code=404, detail="Device not found")
-    return device
-
-
+        device_id: int,
+        db: Session = Depends(get_db)
+):
+    """Получение устройства по ID"""
+    device_crud = crud.DeviceCRUD(db)
+    device = device_crud.get_device(device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device
+
+
 # Проверка статуса устройства (GET /devices/{device_id}/status).
 @router.get("/{device_id}/status", response_model=schemas.DeviceStatusResponse)
 async def get_device_status(
-        device_id: int,
-        db: Session = Depends(get_db)
-):
-    """Проверка статуса устройства"""
-    device_service = service.DeviceService(db)
-    status = await device_service.check_device_availability(device_id)
-    if not status:
-        raise HTTPException(status_code=404, detail="Device not found")
-    return status
-
-
+        device_id: int,
+        db: Session = Depends(get_db)
+):
+    """Проверка статуса устройства"""
+    device_service = service.DeviceService(db)
+    status = await device_service.check_device_availability(device_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return status
+
+
 # Проверка доступности нескольких устройств (POST /devices/check).
 @router.post("/check", response_model=List[schemas.DeviceStatusResponse])
 async def check_devices(
-        device_ids: List[int],
-        db: Session = Depends(get_db)
-):
-    """Проверка доступности нескольких устройств"""
-    device_service = service.DeviceService(db)
-    results = await device_service.check_multiple_devices(device_ids)
-    return results
-
-
+        device_ids: List[int],
+        db: Session = Depends(get_db)
+):
+    """Проверка доступности нескольких устройств"""
+    device_service = service.DeviceService(db)
+    results = await device_service.check_multiple_devices(device_ids)
+    return results
+
+
 # Внутренний эндпоинт: возвращает учетные данные устройства (GET /devices/{device_id}/credentials).
 # Используется сервисами/воркерами и ограничен ролью администратора.
 @router.get("/{device_id}/credentials")
@@ -98,220 +96,195 @@ def get_device_credentials(
         _: None = Depends(require_admin),
         db: Session = Depends(get_db)
 ):
-    """Получение учетных данных устройства (только для внутреннего использования)"""
-    device_service = service.DeviceService(db)
-    credentials = device_service.get_device_credentials(device_id)
-    if not credentials:
-        raise HTTPException(status_code=404, detail="Device not found")
-    return credentials
-
-
+    """Получение учетных данных устройства (только для внутреннего использования)"""
+    device_service = service.DeviceService(db)
+    credentials = device_service.get_device_credentials(device_id)
+    if not credentials:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return credentials
+
+
 # Полное обновление устройства (PUT /devices/{device_id}): требует все поля модели.
 @router.put("/{device_id}", response_model=schemas.DeviceResponse)
 def update_device_full(
-        device_id: int,
-        device_data: schemas.DeviceCreate,
-        db: Session = Depends(get_db)
-):
-    """Полное обновление устройства (PUT - требует все поля)"""
-    device_crud = crud.DeviceCRUD(db)
-
-    # Получаем текущее устройство
-    db_device = device_crud.get_device(device_id)
-    if not db_device:
-        raise HTTPException(status_code=404, detail="Device not found")
-
-    # Создаем словарь с новыми данными
-    update_data = device_data.model_dump()
-    update_data['encrypted_password'] = encrypt_password(update_data.pop('password'))
-
-    # Обновляем все поля
-    for field, value in update_data.items():
-        setattr(db_device, field, value)
-
-    db.commit()
-    db.refresh(db_device)
-    return db_device
-
-
+        device_id: int,
+        device_data: schemas.DeviceCreate,
+        db: Session = Depends(get_db)
+):
+    """Полное обновление устройства (PUT - требует все поля)"""
+    device_crud = crud.DeviceCRUD(db)
+
+    # Получаем текущее устройство
+    db_device = device_crud.get_device(device_id)
+    if not db_device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    # Создаем словарь с новыми данными
+    update_data = device_data.model_dump()
+    update_data['encrypted_password'] = encrypt_password(update_data.pop('password'))
+
+    # Обновляем все поля
+    for field, value in update_data.items():
+        setattr(db_device, field, value)
+
+    db.commit()
+    db.refresh(db_device)
+    # PUT меняет учетные данные напрямую, минуя DeviceCRUD.update_device —
+    # сбрасываем кэш расшифрованных credentials вручную.
+    crud.invalidate_device_credentials(device_id)
+    return db_device
+
+
 # Частичное обновление устройства (PATCH /devices/{device_id}): меняет только указанные поля.
 @router.patch("/{device_id}", response_model=schemas.DeviceResponse)
 def update_device_partial(
-        device_id: int,
-        device_data: schemas.DeviceUpdate,
-        db: Session = Depends(get_db)
-):
-    """Частичное обновление устройства (PATCH - только указанные поля)"""
-    device_crud = crud.DeviceCRUD(db)
-    updated = device_crud.update_device(device_id, device_data)
-    if not updated:
-        raise HTTPException(status_code=404, detail="Device not found")
-    return updated
-
-
+        device_id: int,
+        device_data: schemas.DeviceUpdate,
+        db: Session = Depends(get_db)
+):
+    """Частичное обновление устройства (PATCH - только указанные поля)"""
+    device_crud = crud.DeviceCRUD(db)
+    updated = device_crud.update_device(device_id, device_data)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return updated
+
+
 # Удаление устройства (DELETE /devices/{device_id}).
 @router.delete("/{device_id}")
 def delete_device(
-        device_id: int,
-        db: Session = Depends(get_db)
-):
-    """Удаление устройства"""
-    device_crud = crud.DeviceCRUD(db)
-    success = device_crud.delete_device(device_id)
-    if not success:
-        raise HTTPException(status_code=404, detail="Device not found")
-    return {"message": "Device deleted successfully"}
-
-
+        device_id: int,
+        db: Session = Depends(get_db)
+):
+    """Удаление устройства"""
+    device_crud = crud.DeviceCRUD(db)
+    success = device_crud.delete_device(device_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return {"message": "Device deleted successfully"}
+
+
 # Группы устройств.
 # Создание группы устройств (POST /devices/groups/).
 @router.post("/groups/", response_model=schemas.DeviceGroupResponse)
 def create_group(
-        group: schemas.DeviceGroupCreate,
-        db: Session = Depends(get_db)
-):
-    """Создание новой группы"""
-    group_crud = crud.DeviceGroupCRUD(db)
-
-    # Проверяем уникальность имени
-    existing = db.query(models.DeviceGroup).filter(
-        models.DeviceGroup.name == group.name
-    ).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Group with this name already exists")
-
-    return group_crud.create_group(group)
-
-
+        group: schemas.DeviceGroupCreate,
+        db: Session = Depends(get_db)
+):
+    """Создание новой группы"""
+    group_crud = crud.DeviceGroupCRUD(db)
+
+    # Уникальность имени обеспечивается атомарно на уровне INSERT ... ON CONFLICT.
+    created = group_crud.create_group(group)
+    if created is None:
+        raise HTTPException(status_code=400, detail="Group with this name already exists")
+    return created
+
+
 # Получение всех групп (GET /devices/groups/).
 @router.get("/groups/", response_model=List[schemas.DeviceGroupDetail])
 def get_groups(db: Session = Depends(get_db)):
-    """Получение всех групп с количеством устройств"""
-    group_crud = crud.DeviceGroupCRUD(db)
-    groups = group_crud.get_all_groups()
-
-    result = []
-    for group in groups:
-        # Получаем количество устройств в группе
-        device_count = db.query(models.Device).filter(
-            models.Device.group_id == group.id
-        ).count()
-
-        group_detail = schemas.DeviceGroupDetail(
-            id=group.id,
-            name=group.name,
-            description=group.description,
-            device_count=device_count,
-            created_at=group.created_at
-        )
-        result.append(group_detail)
-
-    return result
-
-
+    """Получение всех групп с количеством устройств"""
+    group_crud = crud.DeviceGroupCRUD(db)
+
+    # Один запрос с агрегатом вместо COUNT(*) на каждую группу.
+    result = []
+    for group, device_count in group_crud.get_all_groups_with_counts():
+        group_detail = schemas.DeviceGroupDetail(
+            id=group.id,
+            name=group.name,
+            description=group.description,
+            device_count=device_count,
+            created_at=group.created_at
+        )
+        result.append(group_detail)
+
+    return result
+
+
 # Получение группы с устройствами (GET /devices/groups/{group_id}).
 @router.get("/groups/{group_id}", response_model=schemas.DeviceGroupWithDevices)
 def get_group(
-        group_id: int,
-        db: Session = Depends(get_db)
-):
-    """Получение группы с устройствами"""
-    group_crud = crud.DeviceGroupCRUD(db)
-    device_crud = crud.DeviceCRUD(db)
-
-    group = group_crud.get_group(group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-
-    # Получаем устройства в группе
-    devices = device_crud.get_devices_by_group(group_id)
-
-    return schemas.DeviceGroupWithDevices(
-        id=group.id,
-        name=group.name,
-        description=group.description,
-        device_count=len(devices),
-        created_at=group.created_at,
-        devices=[schemas.DeviceResponse.from_orm(device) for device in devices]
-    )
-
-
+        group_id: int,
+        db: Session = Depends(get_db)
+):
+    """Получение группы с устройствами"""
+    # Группа и устройства загружаются одним запросом (selectinload),
+    # список валидируется разделяемым TypeAdapter-ом в сервисе.
+    group_service = service.DeviceGroupService(db)
+    group = group_service.get_group_with_devices(group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return group
+
+
 # Проверка устройств в группе (GET /devices/groups/{group_id}/check).
 @router.get("/groups/{group_id}/check", response_model=List[schemas.DeviceStatusResponse])
 async def check_group_devices(
-        group_id: int,
-        db: Session = Depends(get_db)
-):
-    """Проверка всех устройств в группе"""
-    device_crud = crud.DeviceCRUD(db)
-
-    # Проверяем существование группы
-    group_crud = crud.DeviceGroupCRUD(db)
-    group = group_crud.get_group(group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-
-    # Получаем устройства в группе
-    devices = device_crud.get_devices_by_group(group_id)
-    if not devices:
-        return []
-
-    device_ids = [device.id for device in devices]
-
-    # Проверяем устройства
-    device_service = service.DeviceService(db)
-    results = await device_service.check_multiple_devices(device_ids)
-    return results
-
-
+        group_id: int,
+        db: Session = Depends(get_db)
+):
+    """Проверка всех устройств в группе"""
+    # Проверяем существование группы
+    group_crud = crud.DeviceGroupCRUD(db)
+    group = group_crud.get_group(group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    # Учетные данные группы загружаются одним запросом внутри сервиса
+    group_service = service.DeviceGroupService(db)
+    results = await group_service.check_group_devices_availability(group_id)
+    return results
+
+
 # Полное обновление группы (PUT /devices/groups/{group_id}): требует все поля модели.
 @router.put("/groups/{group_id}", response_model=schemas.DeviceGroupResponse)
 def update_group_full(
-        group_id: int,
-        group_data: schemas.DeviceGroupCreate,
-        db: Session = Depends(get_db)
-):
-    """Полное обновление группы (PUT - требует все поля)"""
-    group_crud = crud.DeviceGroupCRUD(db)
-
-    # Получаем текущую группу
-    db_group = group_crud.get_group(group_id)
-    if not db_group:
-        raise HTTPException(status_code=404, detail="Group not found")
-
-    # Обновляем все поля
-    db_group.name = group_data.name
-    db_group.description = group_data.description
-
-    db.commit()
-    db.refresh(db_group)
-    return db_group
-
-
+        group_id: int,
+        group_data: schemas.DeviceGroupCreate,
+        db: Session = Depends(get_db)
+):
+    """Полное обновление группы (PUT - требует все поля)"""
+    group_crud = crud.DeviceGroupCRUD(db)
+
+    # Получаем текущую группу
+    db_group = group_crud.get_group(group_id)
+    if not db_group:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    # Обновляем все поля
+    db_group.name = group_data.name
+    db_group.description = group_data.description
+
+    db.commit()
+    db.refresh(db_group)
+    return db_group
+
+
 # Частичное обновление группы (PATCH /devices/groups/{group_id}): меняет только указанные поля.
 @router.patch("/groups/{group_id}", response_model=schemas.DeviceGroupResponse)
 def update_group_partial(
-        group_id: int,
-        group_data: schemas.DeviceGroupUpdate,
-        db: Session = Depends(get_db)
-):
-    """Частичное обновление группы (PATCH - только указанные поля)"""
-    group_crud = crud.DeviceGroupCRUD(db)
-    updated = group_crud.update_group(group_id, group_data)
-    if not updated:
-        raise HTTPException(status_code=404, detail="Group not found")
-    return updated
-
-
+        group_id: int,
+        group_data: schemas.DeviceGroupUpdate,
+        db: Session = Depends(get_db)
+):
+    """Частичное обновление группы (PATCH - только указанные поля)"""
+    group_crud = crud.DeviceGroupCRUD(db)
+    updated = group_crud.update_group(group_id, group_data)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return updated
+
+
 # Удаление группы (DELETE /devices/groups/{group_id}).
 @router.delete("/groups/{group_id}")
 def delete_group(
-        group_id: int,
-        db: Session = Depends(get_db)
-):
-    """Удаление группы"""
-    group_crud = crud.DeviceGroupCRUD(db)
-    success = group_crud.delete_group(group_id)
-    if not success:
-        raise HTTPException(status_code=404, detail="Group not found")
+        group_id: int,
+        db: Session = Depends(get_db)
+):
+    """Удаление группы"""
+    group_crud = crud.DeviceGroupCRUD(db)
+    success = group_crud.delete_group(group_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Group not found")
     return {"message": "Group deleted successfully"}
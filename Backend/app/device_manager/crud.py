@@ -1,43 +1,119 @@
-# app/device_manager/crud.py
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
-from device_manager import models, schemas
+# app/device_manager/crud.py
+import os
+import time
+
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional, Dict, Any
+from device_manager import models, schemas
 from security import encrypt_password, decrypt_password_with_migration
-from sqlalchemy import func  # Добавьте этот импорт
-
-
-class DeviceCRUD:
-    def __init__(self, db: Session):
-        self.db = db
-
-    def create_device(self, device_data: schemas.DeviceCreate) -> models.Device:
-        """Создание нового устройства с шифрованием пароля"""
-        encrypted_password = encrypt_password(device_data.password)
-
-        db_device = models.Device(
-            name=device_data.name,
-            description=device_data.description,
-            host=device_data.host,
-            api_port=device_data.api_port,
-            ssh_port=device_data.ssh_port,
-            username=device_data.username,
-            encrypted_password=encrypted_password,
-            group_id=device_data.group_id,
-            use_ssl=device_data.use_ssl,
-            check_interval=device_data.check_interval
-        )
-
-        self.db.add(db_device)
-        self.db.commit()
-        self.db.refresh(db_device)
-        return db_device
-
-    def get_device(self, device_id: int) -> Optional[models.Device]:
-        """Получение устройства по ID"""
-        return self.db.query(models.Device).filter(models.Device.id == device_id).first()
-
+from sqlalchemy import delete, func, insert, update  # Добавьте этот импорт
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Диалекты с поддержкой INSERT ... ON CONFLICT DO NOTHING.
+_CONFLICT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _insert_on_conflict_stmt(dialect_name, model, values, index_elements):
+    """INSERT ... ON CONFLICT DO NOTHING RETURNING для поддерживаемых диалектов.
+
+    Один атомарный statement вместо SELECT-проверки + INSERT: закрывает гонку
+    между проверкой уникальности и вставкой и экономит round-trip.
+    """
+    insert_cls = _CONFLICT_INSERTS.get(dialect_name)
+    if insert_cls is not None:
+        return (
+            insert_cls(model)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=index_elements)
+            .returning(model)
+        )
+    return insert(model).values(**values).returning(model)
+
+# In-process TTL-кэш расшифрованных учетных данных: горячие устройства
+# (бэкапы, массовые проверки) не гоняют Fernet-дешифровку на каждый вызов.
+_CREDENTIALS_CACHE_TTL = int(os.getenv("DEVICE_CREDENTIALS_CACHE_TTL", "300"))
+_CREDENTIALS_CACHE_MAXSIZE = 4096
+_credentials_cache: Dict[int, tuple] = {}
+
+
+def invalidate_device_credentials(device_id: int) -> None:
+    """Сброс закэшированных учетных данных устройства (при изменении/удалении)."""
+    _credentials_cache.pop(device_id, None)
+
+
+def _credentials_cache_get(device_id: int) -> Optional[Dict[str, Any]]:
+    cached = _credentials_cache.get(device_id)
+    if not cached:
+        return None
+    expires_at, data = cached
+    if expires_at < time.monotonic():
+        _credentials_cache.pop(device_id, None)
+        return None
+    return data
+
+
+def _credentials_cache_store(device_id: int, data: Dict[str, Any]) -> None:
+    if len(_credentials_cache) >= _CREDENTIALS_CACHE_MAXSIZE:
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in _credentials_cache.items() if expires_at < now]
+        for key in expired:
+            _credentials_cache.pop(key, None)
+        if len(_credentials_cache) >= _CREDENTIALS_CACHE_MAXSIZE:
+            _credentials_cache.pop(next(iter(_credentials_cache)), None)
+    _credentials_cache[device_id] = (time.monotonic() + _CREDENTIALS_CACHE_TTL, data)
+
+
+class DeviceCRUD:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create_device(self, device_data: schemas.DeviceCreate) -> Optional[models.Device]:
+        """Создание нового устройства с шифрованием пароля.
+
+        Возвращает None, если устройство с таким именем уже существует
+        (ON CONFLICT DO NOTHING).
+        """
+        encrypted_password = encrypt_password(device_data.password)
+
+        stmt = _insert_on_conflict_stmt(
+            self.db.get_bind().dialect.name,
+            models.Device,
+            {
+                "name": device_data.name,
+                "description": device_data.description,
+                "host": device_data.host,
+                "api_port": device_data.api_port,
+                "ssh_port": device_data.ssh_port,
+                "username": device_data.username,
+                "encrypted_password": encrypted_password,
+                "group_id": device_data.group_id,
+                "use_ssl": device_data.use_ssl,
+                "check_interval": device_data.check_interval,
+            },
+            index_elements=["name"],
+        )
+        db_device = self.db.execute(stmt).scalar_one_or_none()
+        if db_device is None:
+            self.db.rollback()
+            return None
+        self.db.commit()
+        return db_device
+
+    def get_device(self, device_id: int) -> Optional[models.Device]:
+        """Получение устройства по ID.
+
+        Session.get сначала смотрит в identity map и не ходит в БД,
+        если устройство уже загружено в текущей сессии.
+        """
+        return self.db.get(models.Device, device_id)
+
     def get_device_with_password(self, device_id: int) -> Optional[Dict[str, Any]]:
         """Получение устройства с расшифрованным паролем"""
+        cached = _credentials_cache_get(device_id)
+        if cached is not None:
+            return cached
+
         device = self.get_device(device_id)
         if device:
             password, migrated = decrypt_password_with_migration(device.encrypted_password)
@@ -45,7 +121,7 @@ class DeviceCRUD:
                 device.encrypted_password = migrated
                 self.db.commit()
                 self.db.refresh(device)
-            return {
+            data = {
                 'id': device.id,
                 'name': device.name,
                 'description': device.description,
@@ -58,123 +134,219 @@ class DeviceCRUD:
                 'use_ssl': device.use_ssl,
                 'check_interval': device.check_interval,
                 'is_online': device.is_online,
-                'last_seen': device.last_seen,
-                'last_backup': device.last_backup
-            }
-        return None
-
-    def get_devices_by_group(self, group_id: int) -> List[models.Device]:
-        """Получение всех устройств в группе"""
-        return self.db.query(models.Device).filter(
-            models.Device.group_id == group_id
-        ).all()
-
-    def get_all_devices(self, skip: int = 0, limit: int = 100) -> List[models.Device]:
-        """Получение всех устройств с пагинацией"""
-        return self.db.query(models.Device).offset(skip).limit(limit).all()
-
-    def update_device(self, device_id: int, device_data: schemas.DeviceUpdate) -> Optional[models.Device]:
-        """Частичное обновление устройства (только переданные поля)"""
-        db_device = self.get_device(device_id)
-        if not db_device:
-            return None
-
-        # Получаем только переданные поля (исключаем None)
-        update_data = device_data.model_dump(exclude_unset=True, exclude_none=True)
-
-        # Обработка пароля
-        if 'password' in update_data:
-            update_data['encrypted_password'] = encrypt_password(update_data.pop('password'))
-
-        # Обновляем только переданные поля
-        for field, value in update_data.items():
-            setattr(db_device, field, value)
-
-        self.db.commit()
-        self.db.refresh(db_device)
-        return db_device
-
-    def delete_device(self, device_id: int) -> bool:
-        """Удаление устройства"""
-        db_device = self.get_device(device_id)
-        if not db_device:
-            return False
-
-        self.db.delete(db_device)
-        self.db.commit()
-        return True
-
-    def update_device_status(self, device_id: int, is_online: bool) -> None:
-        """Обновление статуса устройства"""
-        db_device = self.get_device(device_id)
-        if db_device:
-            db_device.is_online = is_online
-            if is_online:
-                from sqlalchemy.sql import func
-                db_device.last_seen = func.now()
+                'last_seen': device.last_seen,
+                'last_backup': device.last_backup,
+                'created_at': device.created_at
+            }
+            _credentials_cache_store(device_id, data)
+            return data
+        return None
+
+    def get_devices_by_group(self, group_id: int) -> List[models.Device]:
+        """Получение всех устройств в группе"""
+        return self.db.query(models.Device).filter(
+            models.Device.group_id == group_id
+        ).all()
+
+    def get_devices_with_passwords_by_group(self, group_id: int) -> List[Dict[str, Any]]:
+        """Учетные данные всех устройств группы одним запросом.
+
+        Устройства загружаются одним SELECT по group_id, пароли
+        расшифровываются за один проход — вместо отдельного запроса
+        на каждое устройство (N+1).
+        """
+        results: List[Dict[str, Any]] = []
+        migrated_any = False
+
+        for device in self.get_devices_by_group(group_id):
+            cached = _credentials_cache_get(device.id)
+            if cached is not None:
+                results.append(cached)
+                continue
+
+            password, migrated = decrypt_password_with_migration(device.encrypted_password)
+            if migrated and migrated != device.encrypted_password:
+                device.encrypted_password = migrated
+                migrated_any = True
+
+            data = {
+                'id': device.id,
+                'name': device.name,
+                'description': device.description,
+                'host': device.host,
+                'api_port': device.api_port,
+                'ssh_port': device.ssh_port,
+                'username': device.username,
+                'password': password,
+                'group_id': device.group_id,
+                'use_ssl': device.use_ssl,
+                'check_interval': device.check_interval,
+                'is_online': device.is_online,
+                'last_seen': device.last_seen,
+                'last_backup': device.last_backup,
+                'created_at': device.created_at
+            }
+            _credentials_cache_store(device.id, data)
+            results.append(data)
+
+        # Миграции ключей фиксируем одним commit после прохода.
+        if migrated_any:
             self.db.commit()
+        return results
 
-    def update_last_backup(self, device_id: int, backup_time) -> None:
-        """Обновление времени последнего бэкапа"""
+    def get_all_devices(self, skip: int = 0, limit: int = 100) -> List[models.Device]:
+        """Получение всех устройств с пагинацией"""
+        return self.db.query(models.Device).offset(skip).limit(limit).all()
+
+    def update_device(self, device_id: int, device_data: schemas.DeviceUpdate) -> Optional[models.Device]:
+        """Частичное обновление устройства (только переданные поля)"""
         db_device = self.get_device(device_id)
-        if db_device:
-            db_device.last_backup = backup_time
-            self.db.commit()
-
-
-class DeviceGroupCRUD:
-    def __init__(self, db: Session):
-        self.db = db
-
-    def create_group(self, group_data: schemas.DeviceGroupCreate) -> models.DeviceGroup:
-        """Создание новой группы"""
-        db_group = models.DeviceGroup(
-            name=group_data.name,
-            description=group_data.description
-        )
-
-        self.db.add(db_group)
-        self.db.commit()
-        self.db.refresh(db_group)
-        return db_group
-
-    def get_group(self, group_id: int) -> Optional[models.DeviceGroup]:
-        """Получение группы по ID"""
-        return self.db.query(models.DeviceGroup).filter(
-            models.DeviceGroup.id == group_id
-        ).first()
-
-    def get_all_groups(self) -> List[models.DeviceGroup]:
-        """Получение всех групп"""
-        return self.db.query(models.DeviceGroup).all()
-
-    def update_group(self, group_id: int, group_data: schemas.DeviceGroupUpdate) -> Optional[models.DeviceGroup]:
-        """Частичное обновление группы (только переданные поля)"""
-        db_group = self.get_group(group_id)
-        if not db_group:
-            return None
-
-        # Получаем только переданные поля (исключаем None)
-        update_data = group_data.model_dump(exclude_unset=True, exclude_none=True)
-
-        # Обновляем только переданные поля
-        for field, value in update_data.items():
-            setattr(db_group, field, value)
-
-        self.db.commit()
-        self.db.refresh(db_group)
-        return db_group
-
-    def delete_group(self, group_id: int) -> bool:
-        """Удаление группы (устройства остаются без группы)"""
-        db_group = self.get_group(group_id)
-        if not db_group:
-            return False
-
-        # Сбрасываем группу у всех устройств
-        for device in db_group.devices:
-            device.group_id = None
-
-        self.db.delete(db_group)
-        self.db.commit()
+        if not db_device:
+            return None
+
+        # Получаем только переданные поля (исключаем None)
+        update_data = device_data.model_dump(exclude_unset=True, exclude_none=True)
+
+        # Обработка пароля
+        if 'password' in update_data:
+            update_data['encrypted_password'] = encrypt_password(update_data.pop('password'))
+
+        # Обновляем только переданные поля
+        for field, value in update_data.items():
+            setattr(db_device, field, value)
+
+        # refresh не нужен: серверные значения при обновлении не затрагиваются,
+        # а объект сохраняет атрибуты после commit (expire_on_commit=False).
+        self.db.commit()
+        invalidate_device_credentials(device_id)
+        return db_device
+
+    def delete_device(self, device_id: int) -> bool:
+        """Удаление устройства"""
+        db_device = self.get_device(device_id)
+        if not db_device:
+            return False
+
+        self.db.delete(db_device)
+        self.db.commit()
+        invalidate_device_credentials(device_id)
+        return True
+
+    def update_device_status(self, device_id: int, is_online: bool) -> None:
+        """Обновление статуса устройства.
+
+        Прямой UPDATE без предварительного SELECT; commit остается за вызывающим,
+        чтобы несколько обновлений укладывались в одну транзакцию.
+        """
+        values = {"is_online": is_online}
+        if is_online:
+            values["last_seen"] = func.now()
+        self.db.execute(
+            update(models.Device).where(models.Device.id == device_id).values(**values)
+        )
+
+    def update_last_backup(self, device_id: int, backup_time) -> None:
+        """Обновление времени последнего бэкапа.
+
+        Прямой UPDATE без предварительного SELECT; commit остается за вызывающим.
+        """
+        self.db.execute(
+            update(models.Device)
+            .where(models.Device.id == device_id)
+            .values(last_backup=backup_time)
+        )
+
+
+class DeviceGroupCRUD:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create_group(self, group_data: schemas.DeviceGroupCreate) -> Optional[models.DeviceGroup]:
+        """Создание новой группы.
+
+        Возвращает None, если группа с таким именем уже существует
+        (ON CONFLICT DO NOTHING).
+        """
+        stmt = _insert_on_conflict_stmt(
+            self.db.get_bind().dialect.name,
+            models.DeviceGroup,
+            {
+                "name": group_data.name,
+                "description": group_data.description,
+            },
+            index_elements=["name"],
+        )
+        db_group = self.db.execute(stmt).scalar_one_or_none()
+        if db_group is None:
+            self.db.rollback()
+            return None
+        self.db.commit()
+        return db_group
+
+    def get_group(self, group_id: int) -> Optional[models.DeviceGroup]:
+        """Получение группы по ID"""
+        return self.db.query(models.DeviceGroup).filter(
+            models.DeviceGroup.id == group_id
+        ).first()
+
+    def get_group_with_devices(self, group_id: int) -> Optional[models.DeviceGroup]:
+        """Получение группы с устройствами одним запросом (selectinload)."""
+        return (
+            self.db.query(models.DeviceGroup)
+            .options(selectinload(models.DeviceGroup.devices))
+            .filter(models.DeviceGroup.id == group_id)
+            .one_or_none()
+        )
+
+    def get_all_groups(self) -> List[models.DeviceGroup]:
+        """Получение всех групп"""
+        return self.db.query(models.DeviceGroup).all()
+
+    def get_all_groups_with_counts(self) -> List[tuple]:
+        """Получение всех групп с количеством устройств одним запросом.
+
+        Вместо отдельного COUNT(*) на каждую группу (N+1) делаем один
+        OUTER JOIN + GROUP BY и возвращаем пары (группа, количество устройств).
+        """
+        return (
+            self.db.query(models.DeviceGroup, func.count(models.Device.id))
+            .outerjoin(models.Device, models.Device.group_id == models.DeviceGroup.id)
+            .group_by(models.DeviceGroup.id)
+            .all()
+        )
+
+    def update_group(self, group_id: int, group_data: schemas.DeviceGroupUpdate) -> Optional[models.DeviceGroup]:
+        """Частичное обновление группы (только переданные поля)"""
+        db_group = self.get_group(group_id)
+        if not db_group:
+            return None
+
+        # Получаем только переданные поля (исключаем None)
+        update_data = group_data.model_dump(exclude_unset=True, exclude_none=True)
+
+        # Обновляем только переданные поля
+        for field, value in update_data.items():
+            setattr(db_group, field, value)
+
+        # refresh не нужен: серверные значения при обновлении не затрагиваются.
+        self.db.commit()
+        return db_group
+
+    def delete_group(self, group_id: int) -> bool:
+        """Удаление группы (устройства остаются без группы)"""
+        db_group = self.get_group(group_id)
+        if not db_group:
+            return False
+
+        # Сбрасываем группу у всех устройств одним UPDATE вместо загрузки
+        # коллекции и UPDATE-на-строку при flush.
+        self.db.execute(
+            update(models.Device)
+            .where(models.Device.group_id == group_id)
+            .values(group_id=None)
+        )
+        self.db.execute(
+            delete(models.DeviceGroup).where(models.DeviceGroup.id == group_id)
+        )
+        self.db.commit()
         return True
@@ -1,5 +1,5 @@
-# app/device_manager/models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+# app/device_manager/models.py
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from db import Base
@@ -25,8 +25,13 @@ class Device(Base):
     """Модель устройства MikroTik"""
     __tablename__ = "devices"
 
+    # Индекс под выборки устройств группы (get_devices_by_group).
+    __table_args__ = (
+        Index("ix_devices_group", "group_id"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)  # Имя/идентификатор устройства.
+    name = Column(String(100), unique=True, nullable=False)  # Имя/идентификатор устройства (уникальное).
     description = Column(Text, nullable=True)  # Дополнительная информация об устройстве.
 
     # Параметры подключения
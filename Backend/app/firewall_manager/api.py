@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 
 from db import get_db
@@ -12,6 +13,8 @@ from firewall_manager.firewall_utils.exceptions import (
 )
 from firewall_manager.schemas import (
     FirewallListAddRequest,
+    FirewallListBulkAddRequest,
+    FirewallListBulkReplaceRequest,
     FirewallListRemoveRequest,
     FirewallListResponse,
     FirewallListOperationResponse,
@@ -21,10 +24,13 @@ from firewall_manager.schemas import (
 from firewall_manager.service import FirewallListService
 
 
+# ORJSONResponse: списки в сотни записей сериализуются orjson-ом заметно
+# быстрее стандартного json.dumps.
 router = APIRouter(
     prefix="/firewall/lists",
     tags=["firewall"],
     dependencies=[Depends(get_current_user)],
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -33,17 +39,22 @@ def _get_service(db: Session) -> FirewallListService:
     return FirewallListService(device_service)
 
 
+# Соответствие типа исключения HTTP-статусу: один lookup по __mro__
+# вместо цепочки isinstance-проверок на горячем пути ошибок.
+_ERROR_STATUS = {
+    AddressAlreadyExists: 409,
+    AddressNotFound: 404,
+    FirewallConnectionError: 503,
+    FirewallOperationError: 500,
+    ValueError: 404,
+}
+
+
 def _raise_http_error(exc: Exception) -> None:
-    if isinstance(exc, AddressAlreadyExists):
-        raise HTTPException(status_code=409, detail=str(exc)) from exc
-    if isinstance(exc, AddressNotFound):
-        raise HTTPException(status_code=404, detail=str(exc)) from exc
-    if isinstance(exc, FirewallConnectionError):
-        raise HTTPException(status_code=503, detail=str(exc)) from exc
-    if isinstance(exc, FirewallOperationError):
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
-    if isinstance(exc, ValueError):
-        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    for exc_type in type(exc).__mro__:
+        status_code = _ERROR_STATUS.get(exc_type)
+        if status_code is not None:
+            raise HTTPException(status_code=status_code, detail=str(exc)) from exc
 
     raise HTTPException(status_code=500, detail="Unexpected firewall error") from exc
 
@@ -148,6 +159,48 @@ async def add_blacklist_entry(
         _raise_http_error(exc)
 
 
+# Bulk-эндпоинты: весь батч уходит одним HTTP-запросом и одной сессией
+# коннектора (конвейер .tag внутри), вместо N вызовов add/remove.
+@router.post(
+    "/bulk/{list_type}",
+    response_model=list[FirewallListOperationResponse],
+)
+async def bulk_add_entries(
+    list_type: FirewallListType,
+    payload: FirewallListBulkAddRequest,
+    db: Session = Depends(get_db),
+):
+    service = _get_service(db)
+    try:
+        return await service.add_addresses_bulk(
+            device_id=payload.device_id,
+            list_type=list_type,
+            items=[entry.model_dump() for entry in payload.entries],
+        )
+    except Exception as exc:
+        _raise_http_error(exc)
+
+
+@router.put(
+    "/bulk/{list_type}",
+    response_model=list[FirewallListOperationResponse],
+)
+async def bulk_replace_list(
+    list_type: FirewallListType,
+    payload: FirewallListBulkReplaceRequest,
+    db: Session = Depends(get_db),
+):
+    service = _get_service(db)
+    try:
+        return await service.replace_list(
+            device_id=payload.device_id,
+            list_type=list_type,
+            items=[entry.model_dump() for entry in payload.entries],
+        )
+    except Exception as exc:
+        _raise_http_error(exc)
+
+
 @router.delete(
     "/whitelist",
     response_model=FirewallListOperationResponse,
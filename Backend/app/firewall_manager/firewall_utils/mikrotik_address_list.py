@@ -1,13 +1,13 @@
-# app/firewall_manager/utils/mikrotik_address_list.py
-
-from typing import List, Dict, Optional
-
+# app/firewall_manager/utils/mikrotik_address_list.py
+
+from typing import List, Dict, Optional
+
 from mikrotik_connector.connector import MikroTikConnector
 from .exceptions import (
     FirewallConnectionError,
     FirewallOperationError,
     AddressAlreadyExists,
-    AddressNotFound,
+    AddressNotFound,
 )
 
 
@@ -22,13 +22,18 @@ async def _fetch_address_entries(
     *,
     list_name: str,
     address: Optional[str] = None,
+    proplist: Optional[str] = None,
 ) -> List[Dict]:
     where = {"list": list_name}
     if address:
         where["address"] = address
+    # proplist ограничивает набор возвращаемых колонок (=.proplist=...):
+    # меньше байтов на запись по проводу и меньше парсинга.
+    params = {".proplist": proplist} if proplist else None
     return await connector.ros_execute(
         path="/ip/firewall/address-list",
         action="print",
+        params=params,
         where=where,
     )
 
@@ -57,8 +62,9 @@ async def address_exists(connector: MikroTikConnector, list_name: str, address:
             connector,
             list_name=list_name,
             address=address,
+            proplist=".id",
         )
-        return len(result) > 0
+        return bool(result)
 
     except Exception as e:
         if "No available API or SSH connection" in str(e):
@@ -74,23 +80,20 @@ async def add_address(
     address: str,
     comment: Optional[str] = None,
 ) -> None:
-    """
-    Добавить адрес в address-list
-    Идемпотентность обеспечивается через предварительную проверку
-    """
-    if await address_exists(connector, list_name, address):
-        raise AddressAlreadyExists(
-            f"Address '{address}' already exists in list '{list_name}'"
-        )
-
+    """
+    Добавить адрес в address-list
+    Идемпотентность обеспечивается самим RouterOS: дубликат возвращает trap,
+    который мы превращаем в AddressAlreadyExists. Предварительный print
+    не нужен — один round-trip вместо двух.
+    """
     payload = {
         "list": list_name,
         "address": address,
-    }
-
-    if comment:
-        payload["comment"] = comment
-
+    }
+
+    if comment:
+        payload["comment"] = comment
+
     try:
         await connector.ros_execute(
             path="/ip/firewall/address-list",
@@ -99,13 +102,89 @@ async def add_address(
         )
 
     except Exception as e:
-        if "No available API or SSH connection" in str(e):
+        message = str(e)
+        if "No available API or SSH connection" in message:
             _raise_connection_error(connector, e)
+        if "already have" in message or "failure: already" in message:
+            raise AddressAlreadyExists(
+                f"Address '{address}' already exists in list '{list_name}'"
+            ) from e
         raise FirewallOperationError(
             f"Failed to add address '{address}' to list '{list_name}'"
         ) from e
 
 
+async def add_addresses_bulk(
+    connector: MikroTikConnector,
+    list_name: str,
+    items: List[Dict],
+) -> List[str]:
+    """
+    Добавить несколько адресов одним конвейером команд (.tag-мультиплексирование).
+
+    Возвращает статус по каждому элементу: "added" либо "skipped"
+    (адрес уже есть в списке). Прочие trap-ы поднимаются как
+    FirewallOperationError.
+    """
+    payloads = []
+    for item in items:
+        payload = {"list": list_name, "address": item["address"]}
+        if item.get("comment"):
+            payload["comment"] = item["comment"]
+        payloads.append(payload)
+
+    try:
+        outcomes = await connector.ros_execute_many(
+            path="/ip/firewall/address-list",
+            action="add",
+            items=payloads,
+        )
+    except Exception as e:
+        if "No available API or SSH connection" in str(e):
+            _raise_connection_error(connector, e)
+        raise FirewallOperationError(
+            f"Failed to bulk-add addresses to list '{list_name}'"
+        ) from e
+
+    statuses = []
+    for item, outcome in zip(items, outcomes):
+        if isinstance(outcome, Exception):
+            message = str(outcome)
+            if "already have" in message or "failure: already" in message:
+                statuses.append("skipped")
+                continue
+            raise FirewallOperationError(
+                f"Failed to add address '{item['address']}' to list '{list_name}'"
+            ) from outcome
+        statuses.append("added")
+    return statuses
+
+
+async def remove_entries_by_ids(
+    connector: MikroTikConnector,
+    list_name: str,
+    ids: List[str],
+) -> None:
+    """
+    Удалить записи по известным .id одним round-trip
+    (RouterOS принимает список ID через запятую).
+    """
+    if not ids:
+        return
+    try:
+        await connector.ros_execute(
+            path="/ip/firewall/address-list",
+            action="remove",
+            params={".id": ",".join(ids)},
+        )
+    except Exception as e:
+        if "No available API or SSH connection" in str(e):
+            _raise_connection_error(connector, e)
+        raise FirewallOperationError(
+            f"Failed to remove entries from list '{list_name}'"
+        ) from e
+
+
 async def remove_address(
     connector: MikroTikConnector,
     list_name: str,
@@ -119,19 +198,24 @@ async def remove_address(
             connector,
             list_name=list_name,
             address=address,
+            proplist=".id",
         )
         if not result:
             raise AddressNotFound(
                 f"Address '{address}' not found in list '{list_name}'"
             )
 
-        for item in result:
-            await connector.ros_execute(
-                path="/ip/firewall/address-list",
-                action="remove",
-                params={".id": item[".id"]},
-            )
+        # RouterOS принимает список ID через запятую: все совпавшие записи
+        # удаляются одним round-trip вместо вызова на каждую.
+        ids = ",".join(item[".id"] for item in result)
+        await connector.ros_execute(
+            path="/ip/firewall/address-list",
+            action="remove",
+            params={".id": ids},
+        )
 
+    except AddressNotFound:
+        raise
     except Exception as e:
         if "No available API or SSH connection" in str(e):
             _raise_connection_error(connector, e)
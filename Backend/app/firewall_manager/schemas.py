@@ -35,6 +35,22 @@ class FirewallListRemoveRequest(BaseModel):
     address: str = Field(..., min_length=1)
 
 
+class FirewallListBulkEntry(BaseModel):
+    address: str = Field(..., min_length=1)
+    comment: Optional[str] = None
+
+
+class FirewallListBulkAddRequest(BaseModel):
+    device_id: int = Field(..., ge=1)
+    entries: List[FirewallListBulkEntry] = Field(..., min_length=1)
+
+
+class FirewallListBulkReplaceRequest(BaseModel):
+    device_id: int = Field(..., ge=1)
+    # Пустой список допустим: replace с entries=[] очищает список.
+    entries: List[FirewallListBulkEntry]
+
+
 class FirewallListOperationResponse(BaseModel):
     device_id: int
     list_type: FirewallListType
@@ -43,9 +59,15 @@ class FirewallListOperationResponse(BaseModel):
     status: str
 
 
+class FirewallGroupListError(BaseModel):
+    device_id: int
+    error: str
+
+
 class FirewallGroupListResponse(BaseModel):
     group_id: int
     group_name: str
     list_type: FirewallListType
     list_name: str
     devices: List[FirewallListResponse]
+    errors: List[FirewallGroupListError] = []
@@ -1,15 +1,23 @@
 import asyncio
-from typing import List, Optional
+import os
+import time
+from typing import Dict, List, Optional, Tuple
 
 from mikrotik_connector import MikroTikConnector
+from mikrotik_connector.utils import connector_pool
 
 from device_manager.service import DeviceGroupService, DeviceService
 from firewall_manager.firewall_utils import mikrotik_address_list
+from firewall_manager.firewall_utils.exceptions import (
+    AddressAlreadyExists,
+    AddressNotFound,
+)
 from firewall_manager.schemas import (
     FirewallListEntry,
     FirewallListResponse,
     FirewallListType,
     FirewallListOperationResponse,
+    FirewallGroupListError,
     FirewallGroupListResponse,
 )
 
@@ -19,16 +27,47 @@ LIST_NAMES = {
     FirewallListType.blacklist: "BLAddress",
 }
 
+# Предвычисленные имена: _get_list_name на горячем пути обходится без
+# hash-lookup по enum-ключу.
+_WHITELIST_NAME = LIST_NAMES[FirewallListType.whitelist]
+_BLACKLIST_NAME = LIST_NAMES[FirewallListType.blacklist]
+
+
 # Примечание: Deny_List используется для детекта сканеров (правила №9-10),
 # а BlackList (BLAddress) — для блокировки трафика (правило №8).
 
+# Короткий TTL-кэш ответов print по (device_id, list_name): фронтенд
+# опрашивает одни и те же списки по всей группе, повторный poll не должен
+# ходить на каждое устройство. Кэш модульный — сервис создается на запрос.
+# Per-key lock коалесцирует конкурентные промахи (single-flight).
+_LIST_CACHE_TTL = int(os.getenv("FW_LIST_CACHE_TTL", "10"))
+_list_cache: Dict[Tuple[int, str], Tuple[float, FirewallListResponse]] = {}
+_list_cache_locks: Dict[Tuple[int, str], asyncio.Lock] = {}
+
+
+def _list_cache_get(key: Tuple[int, str]) -> Optional[FirewallListResponse]:
+    cached = _list_cache.get(key)
+    if not cached:
+        return None
+    expires_at, response = cached
+    if expires_at < time.monotonic():
+        _list_cache.pop(key, None)
+        return None
+    return response
+
+
+def _invalidate_list_cache(device_id: int, list_name: str) -> None:
+    _list_cache.pop((device_id, list_name), None)
+
 
 class FirewallListService:
     def __init__(self, device_service: DeviceService):
         self.device_service = device_service
 
     def _get_list_name(self, list_type: FirewallListType) -> str:
-        return LIST_NAMES[list_type]
+        if list_type is FirewallListType.whitelist:
+            return _WHITELIST_NAME
+        return _BLACKLIST_NAME
 
     def _get_connector(self, device_id: int) -> MikroTikConnector:
         device_data = self.device_service.get_device_credentials(device_id)
@@ -49,34 +88,68 @@ class FirewallListService:
         device_id: int,
         list_type: FirewallListType,
     ) -> FirewallListResponse:
-        connector = self._get_connector(device_id)
         list_name = self._get_list_name(list_type)
 
-        await connector.connect()
-        try:
-            raw_entries = await mikrotik_address_list.get_address_list(
-                connector=connector,
-                list_name=list_name,
+        cache_key = (device_id, list_name)
+        cached = _list_cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        lock = _list_cache_locks.setdefault(cache_key, asyncio.Lock())
+        async with lock:
+            # Пока ждали lock, список мог загрузить параллельный запрос.
+            cached = _list_cache_get(cache_key)
+            if cached is not None:
+                return cached
+
+            # Коннектор из пула: повторные операции на устройстве не платят
+            # за handshake и RouterOS-логин.
+            async with connector_pool.acquire(
+                device_id, lambda: self._get_connector(device_id)
+            ) as connector:
+                raw_entries = await mikrotik_address_list.get_address_list(
+                    connector=connector,
+                    list_name=list_name,
+                )
+
+            response = self._build_list_response(
+                device_id, list_type, list_name, raw_entries
             )
-        finally:
-            await connector.disconnect()
-
-        entries = [
-            FirewallListEntry(
-                id=item.get(".id"),
-                address=item.get("address"),
-                list_name=item.get("list", list_name),
-                comment=item.get("comment"),
-                disabled=item.get("disabled"),
+            _list_cache[cache_key] = (
+                time.monotonic() + _LIST_CACHE_TTL,
+                response,
             )
-            for item in raw_entries
-        ]
+            return response
 
-        return FirewallListResponse(
+    @staticmethod
+    def _build_list_response(
+        device_id: int,
+        list_type: FirewallListType,
+        list_name: str,
+        raw_entries: List[Dict],
+    ) -> FirewallListResponse:
+        # Данные приходят из librouteros уже типизированными (parse_word
+        # кастует bool/int), поэтому model_construct пропускает повторную
+        # валидацию — на списках в тысячи записей это чистая экономия CPU.
+        # Конструктор поднят в локальную переменную: в цикле на 10k записей
+        # атрибутный lookup по классу на каждой итерации заметен. itemgetter
+        # здесь не подходит — comment/disabled обычно отсутствуют, и
+        # KeyError стал бы горячим путем.
+        _entry = FirewallListEntry.model_construct
+        return FirewallListResponse.model_construct(
             device_id=device_id,
             list_type=list_type,
             list_name=list_name,
-            entries=entries,
+            entries=[
+                _entry(
+                    id=item.get(".id"),
+                    address=item.get("address"),
+                    list_name=item.get("list", list_name),
+                    comment=item.get("comment"),
+                    disabled=item.get("disabled"),
+                )
+                for item in raw_entries
+            ],
         )
 
     async def get_group_list(
@@ -95,18 +168,26 @@ class FirewallListService:
             for device in group.devices
         ]
         results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Один недоступный MikroTik не роняет весь групповой запрос:
+        # успешные устройства попадают в devices, ошибки — в errors.
         device_lists: List[FirewallListResponse] = []
-        for result in results:
+        errors: List[FirewallGroupListError] = []
+        for device, result in zip(group.devices, results):
             if isinstance(result, Exception):
-                raise result
-            device_lists.append(result)
+                errors.append(FirewallGroupListError.model_construct(
+                    device_id=device.id, error=str(result)
+                ))
+            else:
+                device_lists.append(result)
 
-        return FirewallGroupListResponse(
+        return FirewallGroupListResponse.model_construct(
             group_id=group_id,
             group_name=group.name,
             list_type=list_type,
             list_name=list_name,
             devices=device_lists,
+            errors=errors,
         )
 
     async def add_address(
@@ -116,20 +197,27 @@ class FirewallListService:
         address: str,
         comment: Optional[str],
     ) -> FirewallListOperationResponse:
-        connector = self._get_connector(device_id)
         list_name = self._get_list_name(list_type)
 
-        await connector.connect()
-        try:
-            await mikrotik_address_list.add_address(
-                connector=connector,
-                list_name=list_name,
-                address=address,
-                comment=comment,
-            )
-        finally:
-            await connector.disconnect()
+        # Семантические ошибки (дубликат) перекидываем за пределы блока:
+        # соединение живое, ронять его из пула незачем.
+        semantic_error: Optional[Exception] = None
+        async with connector_pool.acquire(
+            device_id, lambda: self._get_connector(device_id)
+        ) as connector:
+            try:
+                await mikrotik_address_list.add_address(
+                    connector=connector,
+                    list_name=list_name,
+                    address=address,
+                    comment=comment,
+                )
+            except AddressAlreadyExists as exc:
+                semantic_error = exc
+        if semantic_error is not None:
+            raise semantic_error
 
+        _invalidate_list_cache(device_id, list_name)
         return FirewallListOperationResponse(
             device_id=device_id,
             list_type=list_type,
@@ -138,25 +226,142 @@ class FirewallListService:
             status="added",
         )
 
-    async def remove_address(
+    async def add_addresses_bulk(
         self,
         device_id: int,
         list_type: FirewallListType,
-        address: str,
-    ) -> FirewallListOperationResponse:
-        connector = self._get_connector(device_id)
+        items: List[Dict[str, Optional[str]]],
+    ) -> List[FirewallListOperationResponse]:
+        """Массовое добавление адресов в список.
+
+        Все команды уходят одним конвейером по одному соединению
+        (.tag-мультиплексирование); уже существующий адрес помечается
+        статусом "skipped", а не прерывает весь батч.
+        """
+        list_name = self._get_list_name(list_type)
+
+        async with connector_pool.acquire(
+            device_id, lambda: self._get_connector(device_id)
+        ) as connector:
+            statuses = await mikrotik_address_list.add_addresses_bulk(
+                connector=connector,
+                list_name=list_name,
+                items=items,
+            )
+
+        _invalidate_list_cache(device_id, list_name)
+        return [
+            FirewallListOperationResponse(
+                device_id=device_id,
+                list_type=list_type,
+                list_name=list_name,
+                address=item["address"],
+                status=status,
+            )
+            for item, status in zip(items, statuses)
+        ]
+
+    async def replace_list(
+        self,
+        device_id: int,
+        list_type: FirewallListType,
+        items: List[Dict[str, Optional[str]]],
+    ) -> List[FirewallListOperationResponse]:
+        """Привести список на устройстве к заданному набору адресов.
+
+        Текущее содержимое читается один раз, дальше на устройство уходят
+        только диффы: удаление лишних записей одной командой (.id через
+        запятую) и конвейерное добавление недостающих. Совпадающие адреса
+        не трогаются и помечаются статусом "kept".
+        """
         list_name = self._get_list_name(list_type)
+        desired = {item["address"]: item for item in items}
+
+        async with connector_pool.acquire(
+            device_id, lambda: self._get_connector(device_id)
+        ) as connector:
+            existing = await mikrotik_address_list.get_address_list(
+                connector=connector,
+                list_name=list_name,
+            )
+
+            kept: List[str] = []
+            stale_ids: List[str] = []
+            removed: List[str] = []
+            for entry in existing:
+                address = entry.get("address")
+                if address in desired:
+                    kept.append(address)
+                else:
+                    stale_ids.append(entry[".id"])
+                    removed.append(address)
 
-        await connector.connect()
-        try:
-            await mikrotik_address_list.remove_address(
+            kept_set = set(kept)
+            to_add = [
+                item for address, item in desired.items()
+                if address not in kept_set
+            ]
+
+            await mikrotik_address_list.remove_entries_by_ids(
                 connector=connector,
                 list_name=list_name,
+                ids=stale_ids,
+            )
+            add_statuses = (
+                await mikrotik_address_list.add_addresses_bulk(
+                    connector=connector,
+                    list_name=list_name,
+                    items=to_add,
+                )
+                if to_add
+                else []
+            )
+
+        _invalidate_list_cache(device_id, list_name)
+
+        def _response(address: str, status: str) -> FirewallListOperationResponse:
+            return FirewallListOperationResponse(
+                device_id=device_id,
+                list_type=list_type,
+                list_name=list_name,
                 address=address,
+                status=status,
             )
-        finally:
-            await connector.disconnect()
 
+        return (
+            [_response(address, "removed") for address in removed]
+            + [_response(address, "kept") for address in kept]
+            + [
+                _response(item["address"], status)
+                for item, status in zip(to_add, add_statuses)
+            ]
+        )
+
+    async def remove_address(
+        self,
+        device_id: int,
+        list_type: FirewallListType,
+        address: str,
+    ) -> FirewallListOperationResponse:
+        list_name = self._get_list_name(list_type)
+
+        # Отсутствие адреса — не повод ронять живое соединение из пула.
+        semantic_error: Optional[Exception] = None
+        async with connector_pool.acquire(
+            device_id, lambda: self._get_connector(device_id)
+        ) as connector:
+            try:
+                await mikrotik_address_list.remove_address(
+                    connector=connector,
+                    list_name=list_name,
+                    address=address,
+                )
+            except AddressNotFound as exc:
+                semantic_error = exc
+        if semantic_error is not None:
+            raise semantic_error
+
+        _invalidate_list_cache(device_id, list_name)
         return FirewallListOperationResponse(
             device_id=device_id,
             list_type=list_type,
@@ -1,29 +1,42 @@
-# main.py
-from fastapi import FastAPI
-from contextlib import asynccontextmanager
-from db import engine, Base
-
+# main.py
+import asyncio
+import os
+
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, Response
+from contextlib import asynccontextmanager
+from db import engine, Base
+
 from device_manager.api import router as device_router
 from backup_manager.api import router as backup_router
 from task_manager import models as task_models
 from firewall_manager.api import router as firewall_router
 from task_manager.scheduler import create_scheduler_from_env
+from mikrotik_connector.utils import connector_pool
 
 import uvicorn
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.openapi.docs import get_swagger_ui_html
-from fastapi.openapi.utils import get_openapi
-
-
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.openapi.utils import get_openapi
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     # На старте сервиса поднимаем инфраструктуру: создаем таблицы и запускаем scheduler.
-    # Создаем таблицы в БД при старте
+    # Создаем таблицы в БД при старте. DDL уходит в поток, чтобы не блокировать
+    # event loop (и readiness-пробы) на время миграции схемы.
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    await asyncio.to_thread(Base.metadata.create_all, engine)
     print("Database tables created successfully!")
+    # Схема OpenAPI строится один раз на старте (а не на первом hit, где
+    # конкурентные запросы могли запустить несколько параллельных генераций)
+    # и сразу сериализуется в байты для отдачи без повторного dumps.
+    app.openapi_schema = custom_openapi()
+    app.state.openapi_bytes = orjson.dumps(app.openapi_schema)
     scheduler = create_scheduler_from_env()
     if scheduler:
         scheduler.start()
@@ -33,99 +46,135 @@ async def lifespan(app: FastAPI):
     # При завершении работы корректно останавливаем scheduler и освобождаем ресурсы.
     if scheduler:
         await scheduler.stop()
+    # Закрываем удерживаемые пулом RouterOS/SSH-сессии.
+    await connector_pool.close_all()
     print("Shutting down application...")
-
-
+
+
 # Создаем FastAPI приложение: задаем метаданные (title/description/docs) и lifecycle (lifespan).
+# default_response_class=ORJSONResponse: все ответы сериализуются orjson-ом
+# (C-путь) вместо стандартного json.dumps.
 app = FastAPI(
     title="MikroTik ITT Central Manager",
     description="Веб-приложение для централизованного управления устройствами MikroTik",
     version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    lifespan=lifespan
-)
-
-# Настройка CORS: разрешаем кросс-доменные запросы для фронтенда/клиентов API.
+    # Встроенные маршруты openapi/docs/redoc отключены: ниже объявлены свои,
+    # отдающие предсобранную схему без повторной сериализации.
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+# Сжимаем крупные JSON-ответы (групповые списки firewall хорошо жмутся).
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Настройка CORS: конкретные домены берутся из CORS_ALLOWED_ORIGINS (через
+# запятую). Комбинация allow_origins=["*"] + allow_credentials=True невалидна
+# по спецификации и гнала Starlette по медленному пути echo-origin, поэтому
+# credentials включаются только при явном списке доменов.
+_cors_origins = [
+    origin.strip()
+    for origin in os.getenv("CORS_ALLOWED_ORIGINS", "").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # В продакшене заменить на конкретные домены
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
+    allow_origins=_cors_origins or ["*"],
+    allow_credentials=bool(_cors_origins),
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
 # Подключаем роутеры микросервисов: регистрируем endpoints подсистем.
 
 app.include_router(device_router)
 app.include_router(backup_router)
 app.include_router(firewall_router)
-
-
-
+
+
+
 # Маршруты для проверки здоровья приложения и базового статуса API.
 @app.get("/")
 async def root():
     """Корневой маршрут - информация о приложении"""
     return {
-        "message": "MikroTik ITT Central Manager API",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "status": "running"
-    }
-
-
+        "message": "MikroTik ITT Central Manager API",
+        "version": "1.0.0",
+        "docs": "/docs",
+        "status": "running"
+    }
+
+
 @app.get("/health")
 async def health_check():
     """Проверка состояния приложения"""
     return {
-        "status": "healthy",
-        "database": "connected",
-        "timestamp": "2024-01-13T10:00:00Z"
-    }
-
-
+        "status": "healthy",
+        "database": "connected",
+        "timestamp": "2024-01-13T10:00:00Z"
+    }
+
+
 @app.get("/api/v1/status")
 async def api_status():
     """Статус API"""
     return {
-        "api_version": "1.0",
-        "services": {
-            "device_manager": "active",
-            "firewall_manager": "active",
-            "mikrotik_connector": "active"
-        },
-        "endpoints": {
-            "devices": "/devices/",
-            "device_groups": "/devices/groups/",
-            "device_status": "/devices/{id}/status",
-            "firewall_lists": "/firewall/lists/"
-        }
-    }
-
-
+        "api_version": "1.0",
+        "services": {
+            "device_manager": "active",
+            "firewall_manager": "active",
+            "mikrotik_connector": "active"
+        },
+        "endpoints": {
+            "devices": "/devices/",
+            "device_groups": "/devices/groups/",
+            "device_status": "/devices/{id}/status",
+            "firewall_lists": "/firewall/lists/"
+        }
+    }
+
+
+# Схема OpenAPI: предсобранные байты из lifespan, без повторного dumps.
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi_json():
+    return Response(
+        content=app.state.openapi_bytes,
+        media_type="application/json",
+    )
+
+
 # Кастомная документация Swagger: переопределяем UI и favicon.
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     return get_swagger_ui_html(
         openapi_url="/openapi.json",
-        title="MikroTik Manager API",
-        swagger_favicon_url="https://fastapi.tiangolo.com/img/favicon.png",
-    )
-
-
+        title="MikroTik Manager API",
+        swagger_favicon_url="https://fastapi.tiangolo.com/img/favicon.png",
+    )
+
+
+@app.get("/redoc", include_in_schema=False)
+async def custom_redoc_html():
+    return get_redoc_html(
+        openapi_url="/openapi.json",
+        title="MikroTik Manager API",
+    )
+
+
 # Кастомная OpenAPI схема: настраиваем метаданные и security-схему.
 def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
-
-    openapi_schema = get_openapi(
-        title="MikroTik ITT Central Manager API",
-        version="1.0.0",
-        description="API для управления устройствами MikroTik",
-        routes=app.routes,
-    )
-
+    if app.openapi_schema:
+        return app.openapi_schema
+
+    openapi_schema = get_openapi(
+        title="MikroTik ITT Central Manager API",
+        version="1.0.0",
+        description="API для управления устройствами MikroTik",
+        routes=app.routes,
+    )
+
     # Добавляем информацию о безопасности
     components = openapi_schema.setdefault("components", {})
     security_schemes = components.setdefault("securitySchemes", {})
@@ -134,20 +183,29 @@ def custom_openapi():
         "scheme": "bearer",
         "bearerFormat": "JWT",
     }
-
-    app.openapi_schema = openapi_schema
-    return app.openapi_schema
-
-
-app.openapi = custom_openapi
-
-if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-
-    )
-
+
+    app.openapi_schema = openapi_schema
+    return app.openapi_schema
+
+
+app.openapi = custom_openapi
+
+if __name__ == "__main__":
+    # loop/http "auto": uvicorn сам берет uvloop и httptools, если они
+    # установлены (заметно меньше оверхеда event loop и HTTP-парсинга на
+    # запрос), и откатывается на asyncio/h11 там, где их нет (dev на
+    # Windows). reload=True убран — в проде он держит лишний
+    # watcher-процесс и несовместим с workers.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_WORKERS", "1")),
+        log_level="info",
+        # Access-log — это запись в stdout на каждый запрос; за
+        # nginx/traefik он дублирует фронтовые логи. Включается через env.
+        access_log=os.getenv("UVICORN_ACCESS_LOG", "0") == "1",
+    )
+
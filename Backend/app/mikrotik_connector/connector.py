@@ -1,33 +1,70 @@
 import os
 import asyncio
+import logging
+import re
+import shutil
 from typing import Optional, Dict, List
 
 from librouteros import connect
-from librouteros.exceptions import LibRouterosError
+from librouteros.exceptions import LibRouterosError, TrapError
+from librouteros.protocol import parse_word
 import paramiko
-from mikrotik_connector.utils import acquire_connection_slot, release_connection_slot
+from mikrotik_connector.utils import (
+    acquire_connection_slot,
+    get_io_executor,
+    release_connection_slot,
+)
+
+# Предкомпилированный парсер пар key=value для SSH print-вывода: один
+# C-проход по строке вместо split-ов на каждый токен. Работает по байтам,
+# чтобы не декодировать весь вывод целиком.
+_KV_RE = re.compile(rb'(\S+?)=("[^"]*"|\S*)')
+
+# Символы, требующие кавычек в значениях команд консоли RouterOS.
+_CLI_UNSAFE_RE = re.compile(r'[\s"\\;$(){}\[\]]')
+
+# Ленивое логирование вместо print: f-строка + блокирующий flush stdout
+# сериализовали конкурентные коннекторы при фан-ауте по группе.
+logger = logging.getLogger(__name__)
+
+
+class _ApiPipelineDesync(RuntimeError):
+    """Конвейер с тегами сломался после записи батча.
+
+    Команды уже ушли на роутер и могли выполниться, а в сокете остались
+    невычитанные реплики — сессия рассинхронизирована, и повторять батч
+    по SSH-fallback-у нельзя.
+    """
+
+
+class _ApiCommandError(RuntimeError):
+    """Роутер принял команду и ответил trap-ом (например, дубликат записи).
+
+    Ошибка уровня команды, а не транспорта: SSH-fallback выполнил бы ту же
+    команду второй раз, поэтому она пробрасывается вызывающему коду как есть.
+    """
 
 
 class MikroTikConnector:
-    def __init__(
-        self,
-        host: str,
-        username: str,
-        password: str,
-        api_port: int = 8728,
-        ssh_port: int = 22,
-        use_ssl: bool = False,
-        api_timeout: int = 5,
-    ):
-        self.host = host
-        self.username = username
-        self.password = password
-
-        self.api_port = api_port
-        self.ssh_port = ssh_port
-        self.use_ssl = use_ssl
-        self.api_timeout = api_timeout
-
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        api_port: int = 8728,
+        ssh_port: int = 22,
+        use_ssl: bool = False,
+        api_timeout: int = 5,
+    ):
+        self.host = host
+        self.username = username
+        self.password = password
+
+        self.api_port = api_port
+        self.ssh_port = ssh_port
+        self.use_ssl = use_ssl
+        self.api_timeout = api_timeout
+
         self.api_connection = None
         self.ssh_client = None
         self.sftp_client = None
@@ -46,251 +83,416 @@ class MikroTikConnector:
         if not self._connection_slot_acquired:
             await acquire_connection_slot()
             self._connection_slot_acquired = True
-        await self._connect_api()
-        self._connect_ssh()
+        # Оба handshake блокирующие и уведены в пул потоков, поэтому их
+        # можно запускать параллельно: worst-case время подключения равно
+        # максимуму из двух таймаутов, а не их сумме.
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            self._connect_api(),
+            loop.run_in_executor(get_io_executor(), self._connect_ssh),
+        )
         if not self.api_connection and not self.ssh_client:
             self._release_connection_slot()
 
     async def disconnect(self):
         await self._disconnect_api()
-        self._disconnect_ssh()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(get_io_executor(), self._disconnect_ssh)
         self._release_connection_slot()
 
     def _release_connection_slot(self) -> None:
         if self._connection_slot_acquired:
             release_connection_slot()
             self._connection_slot_acquired = False
-
-    # ---------------- API ---------------- #
-
-    async def _connect_api(self):
-        loop = asyncio.get_event_loop()
-
-        try:
-            self.api_connection = await loop.run_in_executor(
-                None,
-                lambda: connect(
-                    host=self.host,
-                    username=self.username,
-                    password=self.password,
-                    port=self.api_port,
-                    use_ssl=self.use_ssl,
-                    timeout=self.api_timeout,
-                ),
-            )
-            print(f"[API] Connected to {self.host}")
-        except Exception as e:
-            self.api_connection = None
-            print(f"[API] Connection failed: {e}")
-
+
+    # Парковка в пуле: слот лимита считает активные операции, а не живые
+    # сессии. Пул возвращает слот, когда коннектор простаивает, и занимает
+    # его заново при следующей выдаче — иначе припаркованные коннекторы
+    # выедают лимит и fan-out по устройствам сверх него ждет эвиктора.
+
+    async def hold_connection_slot(self) -> None:
+        if not self._connection_slot_acquired:
+            await acquire_connection_slot()
+            self._connection_slot_acquired = True
+
+    def yield_connection_slot(self) -> None:
+        self._release_connection_slot()
+
+    # ---------------- API ---------------- #
+
+    async def _connect_api(self):
+        loop = asyncio.get_running_loop()
+
+        try:
+            self.api_connection = await loop.run_in_executor(
+                get_io_executor(),
+                lambda: connect(
+                    host=self.host,
+                    username=self.username,
+                    password=self.password,
+                    port=self.api_port,
+                    use_ssl=self.use_ssl,
+                    timeout=self.api_timeout,
+                ),
+            )
+            logger.info("[API] Connected to %s", self.host)
+        except Exception as e:
+            self.api_connection = None
+            logger.warning("[API] Connection to %s failed: %s", self.host, e)
+
     async def _disconnect_api(self):
         try:
             if self.api_connection:
                 self.api_connection.close()
         finally:
             self.api_connection = None
-            print(f"[API] Disconnected from {self.host}")
+            logger.info("[API] Disconnected from %s", self.host)
 
     def get_api(self):
         if not self.api_connection:
             raise RuntimeError("API connection not established")
         return self.api_connection
-
-    # ---------------- SSH ---------------- #
-
-    def _connect_ssh(self):
-        try:
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(
-                paramiko.AutoAddPolicy()
-            )
-            self.ssh_client.connect(
-                hostname=self.host,
-                port=self.ssh_port,
-                username=self.username,
-                password=self.password,
-                look_for_keys=False,
-                allow_agent=False,
-                timeout=10,
-            )
-            self.sftp_client = self.ssh_client.open_sftp()
-            print(f"[SSH] Connected to {self.host}")
-        except Exception as e:
-            self.ssh_client = None
-            self.sftp_client = None
-            print(f"[SSH] Connection failed: {e}")
-
-    def _disconnect_ssh(self):
-        try:
-            if self.sftp_client:
-                self.sftp_client.close()
-            if self.ssh_client:
-                self.ssh_client.close()
-        finally:
-            self.sftp_client = None
-            self.ssh_client = None
-            print(f"[SSH] Disconnected from {self.host}")
-
-    # ------------------------------------------------------------------
-    # UNIFIED ROUTEROS EXECUTION
-    # ------------------------------------------------------------------
-
-    async def ros_execute(
-        self,
-        path: str,
-        *,
-        action: str,
-        params: Optional[Dict] = None,
-        where: Optional[Dict] = None,
-    ) -> List[Dict]:
-        """
-        Унифицированное выполнение RouterOS-команд.
-
-        Сначала API → при ошибке fallback на SSH.
-
-        path: "/ip/firewall/address-list"
-        action: print | add | remove
-        """
-        params = params or {}
-        where = where or {}
-
-        # 1. API
-        if self.api_connection:
-            try:
-                return await self._execute_api(path, action, params, where)
-            except Exception as e:
-                print(f"[ROS] API failed, fallback to SSH: {e}")
-
-        # 2. SSH fallback
-        if self.ssh_client:
-            return self._execute_ssh(path, action, params, where)
-
-        raise RuntimeError("No available API or SSH connection")
-
-    # ------------------------------------------------------------------
-    # API IMPLEMENTATION
-    # ------------------------------------------------------------------
-
-    async def _execute_api(
-            self,
-            path: str,
-            action: str,
-            params: Dict,
-            where: Dict,
-    ) -> List[Dict]:
-        loop = asyncio.get_event_loop()
-
-        def _call():
-            if action == "print":
-                if where:
-                    return list(self.api_connection(f"{path}/print", where=where))
-                else:
-                    return list(self.api_connection(f"{path}/print"))
-
-            elif action == "add":
-                if params:
-                    self.api_connection(f"{path}/add", **params)
-                else:
-                    self.api_connection(f"{path}/add")
-                return []
-
-            elif action == "remove":
-                if params:
-                    self.api_connection(f"{path}/remove", **params)
-                else:
-                    raise ValueError("Missing parameters for remove")
-                return []
-
-            else:
-                raise ValueError(f"Unsupported action: {action}")
-
-        try:
-            return await loop.run_in_executor(None, _call)
-        except LibRouterosError as e:
-            raise RuntimeError(f"API error: {e}") from e
-
-    # ------------------------------------------------------------------
-    # SSH IMPLEMENTATION (CLI)
-    # ------------------------------------------------------------------
-
-    def _execute_ssh(
-        self,
-        path: str,
-        action: str,
-        params: Dict,
-        where: Dict,
-    ) -> List[Dict]:
-        base = path.strip("/").replace("/", " ")
-
-        if action == "print":
-            cmd = f"/{base} print"
-            out, err = self._run_ssh(cmd)
-            if err:
-                raise RuntimeError(err)
-            return self._parse_print(out)
-
-        elif action == "add":
-            args = " ".join(f"{k}={v}" for k, v in params.items())
-            cmd = f"/{base} add {args}"
-            self._run_ssh(cmd)
-            return []
-
-        elif action == "remove":
-            if ".id" not in params:
-                raise ValueError("Missing .id for remove")
-            cmd = f"/{base} remove {params['.id']}"
-            self._run_ssh(cmd)
-            return []
-
-        else:
-            raise ValueError(f"Unsupported action: {action}")
-
+
+    # ---------------- SSH ---------------- #
+
+    def _connect_ssh(self):
+        try:
+            self.ssh_client = paramiko.SSHClient()
+            self.ssh_client.set_missing_host_key_policy(
+                paramiko.AutoAddPolicy()
+            )
+            self.ssh_client.connect(
+                hostname=self.host,
+                port=self.ssh_port,
+                username=self.username,
+                password=self.password,
+                look_for_keys=False,
+                allow_agent=False,
+                timeout=10,
+            )
+            self.sftp_client = self.ssh_client.open_sftp()
+            logger.info("[SSH] Connected to %s", self.host)
+        except Exception as e:
+            self.ssh_client = None
+            self.sftp_client = None
+            logger.warning("[SSH] Connection to %s failed: %s", self.host, e)
+
+    def _disconnect_ssh(self):
+        try:
+            if self.sftp_client:
+                self.sftp_client.close()
+            if self.ssh_client:
+                self.ssh_client.close()
+        finally:
+            self.sftp_client = None
+            self.ssh_client = None
+            logger.info("[SSH] Disconnected from %s", self.host)
+
+    # ------------------------------------------------------------------
+    # UNIFIED ROUTEROS EXECUTION
+    # ------------------------------------------------------------------
+
+    async def ros_execute(
+        self,
+        path: str,
+        *,
+        action: str,
+        params: Optional[Dict] = None,
+        where: Optional[Dict] = None,
+    ) -> List[Dict]:
+        """
+        Унифицированное выполнение RouterOS-команд.
+
+        Сначала API → при ошибке fallback на SSH.
+
+        path: "/ip/firewall/address-list"
+        action: print | add | remove
+        """
+        params = params or {}
+        where = where or {}
+
+        # 1. API
+        if self.api_connection:
+            try:
+                return await self._execute_api(path, action, params, where)
+            except _ApiCommandError:
+                # Роутер команду выполнил и отверг — повтор по SSH не нужен.
+                raise
+            except Exception as e:
+                logger.warning("[ROS] API failed on %s, fallback to SSH: %s", self.host, e)
+
+        # 2. SSH fallback (блокирующий exec_command — тоже в пул потоков)
+        if self.ssh_client:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                get_io_executor(),
+                lambda: self._execute_ssh(path, action, params, where),
+            )
+
+        raise RuntimeError("No available API or SSH connection")
+
+    async def ros_execute_many(
+        self,
+        path: str,
+        *,
+        action: str,
+        items: List[Dict],
+    ) -> List:
+        """
+        Пакетное выполнение однотипных команд (add/remove) одним конвейером.
+
+        По API все предложения пишутся сразу с .tag=<i>, ответы вычитываются
+        по мере прихода и раскладываются по тегам — N round-trip-ов
+        схлопываются в один. Элемент результата: список ответных слов при
+        успехе либо исключение (trap) для конкретной команды.
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        # 1. API (конвейер с тегами)
+        if self.api_connection:
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    get_io_executor(),
+                    lambda: self._execute_api_many(path, action, items),
+                )
+            except _ApiPipelineDesync as e:
+                # Батч мог выполниться на роутере — повтор по SSH недопустим.
+                logger.warning("[ROS] API pipeline broke on %s: %s", self.host, e)
+                raise
+            except Exception as e:
+                logger.warning("[ROS] API failed on %s, fallback to SSH: %s", self.host, e)
+
+        # 2. SSH fallback: все команды склеиваются в один exec-запрос —
+        # один SSH-канал (один CHANNEL_OPEN round-trip) на весь батч вместо
+        # канала на каждый адрес. Вывод add/remove пустой, поэтому потери
+        # per-item результатов нет (как и в _execute_ssh).
+        if self.ssh_client:
+            script = "; ".join(
+                self._build_ssh_command(path, action, dict(item)) for item in items
+            )
+            loop = asyncio.get_running_loop()
+            _, err = await loop.run_in_executor(
+                get_io_executor(), self._run_ssh, script
+            )
+            if err:
+                raise RuntimeError(err.decode())
+            return [[] for _ in items]
+
+        raise RuntimeError("No available API or SSH connection")
+
+    # ------------------------------------------------------------------
+    # API IMPLEMENTATION
+    # ------------------------------------------------------------------
+
+    async def _execute_api(
+            self,
+            path: str,
+            action: str,
+            params: Dict,
+            where: Dict,
+    ) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+
+        def _call():
+            if action == "print":
+                # params для print несут служебные слова запроса
+                # (например .proplist — отдает только нужные колонки).
+                kwargs = dict(params)
+                if where:
+                    kwargs["where"] = where
+                return list(self.api_connection(f"{path}/print", **kwargs))
+
+            elif action == "add":
+                # Api.__call__ — генератор: без материализации команда даже
+                # не пишется в сокет, а trap (например, дубликат) не
+                # поднимается. tuple() выполняет команду и вычитывает ответ.
+                if params:
+                    tuple(self.api_connection(f"{path}/add", **params))
+                else:
+                    tuple(self.api_connection(f"{path}/add"))
+                return []
+
+            elif action == "remove":
+                if params:
+                    tuple(self.api_connection(f"{path}/remove", **params))
+                else:
+                    raise ValueError("Missing parameters for remove")
+                return []
+
+            else:
+                raise ValueError(f"Unsupported action: {action}")
+
+        try:
+            return await loop.run_in_executor(get_io_executor(), _call)
+        except TrapError as e:
+            raise _ApiCommandError(f"API error: {e}") from e
+        except LibRouterosError as e:
+            raise RuntimeError(f"API error: {e}") from e
+
+    def _execute_api_many(self, path: str, action: str, items: List[Dict]) -> List:
+        if action not in ("add", "remove"):
+            raise ValueError(f"Unsupported action: {action}")
+
+        cmd = f"{path}/{action}"
+        protocol = self.api_connection.protocol
+
+        # Сначала пишем все предложения, каждое со своим .tag.
+        for tag, params in enumerate(items):
+            words = [f"={key}={value}" for key, value in params.items()]
+            words.append(f".tag={tag}")
+            protocol.writeSentence(cmd, *words)
+
+        # Затем вычитываем ответы до !done каждого тега. Читаем сырые
+        # предложения через protocol: Api.readSentence гонит каждое слово
+        # через parse_word, который требует ведущий "=", а тег приходит
+        # словом ".tag=N" без него и ронял бы разбор первой же реплики.
+        try:
+            results: List = [[] for _ in items]
+            pending = len(items)
+            while pending:
+                reply_word, raw_words = protocol.readSentence()
+                tag = 0
+                attrs: Dict = {}
+                for word in raw_words:
+                    if word.startswith(".tag="):
+                        tag = int(word[5:])
+                    elif word.startswith("="):
+                        key, value = parse_word(word)
+                        attrs[key] = value
+                if reply_word == "!trap":
+                    message = attrs.get("message", str(attrs))
+                    results[tag] = RuntimeError(f"API error: {message}")
+                elif reply_word == "!re":
+                    if isinstance(results[tag], list):
+                        results[tag].append(attrs)
+                elif reply_word == "!done":
+                    pending -= 1
+            return results
+        except Exception as e:
+            # Батч уже записан и мог выполниться, а в сокете остались
+            # невычитанные реплики — сессия рассинхронизирована. Роняем
+            # соединение (следующий вызов переподключится) и поднимаем
+            # ошибку, запрещающую SSH-fallback: он выполнил бы батч заново.
+            try:
+                self.api_connection.close()
+            except Exception:
+                pass
+            finally:
+                self.api_connection = None
+            raise _ApiPipelineDesync(f"API pipeline failed: {e}") from e
+
+    # ------------------------------------------------------------------
+    # SSH IMPLEMENTATION (CLI)
+    # ------------------------------------------------------------------
+
+    def _execute_ssh(
+        self,
+        path: str,
+        action: str,
+        params: Dict,
+        where: Dict,
+    ) -> List[Dict]:
+        base = path.strip("/").replace("/", " ")
+
+        if action == "print":
+            cmd = f"/{base} print"
+            out, err = self._run_ssh(cmd)
+            if err:
+                raise RuntimeError(err.decode())
+            return self._parse_print(out)
+
+        elif action in ("add", "remove"):
+            self._run_ssh(self._build_ssh_command(path, action, params))
+            return []
+
+        else:
+            raise ValueError(f"Unsupported action: {action}")
+
+    @staticmethod
+    def _quote_cli_value(value) -> str:
+        # Значения с пробелами/спецсимволами (типичный случай — comment)
+        # без кавычек ломали CLI-команду на границе слова. Экранируем
+        # по правилам консоли RouterOS: backslash и кавычки внутри строки.
+        text = str(value)
+        if text and not _CLI_UNSAFE_RE.search(text):
+            return text
+        escaped = text.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+
+    def _build_ssh_command(self, path: str, action: str, params: Dict) -> str:
+        base = path.strip("/").replace("/", " ")
+        if action == "add":
+            args = " ".join(
+                f"{k}={self._quote_cli_value(v)}" for k, v in params.items()
+            )
+            return f"/{base} add {args}"
+        if action == "remove":
+            if ".id" not in params:
+                raise ValueError("Missing .id for remove")
+            return f"/{base} remove {params['.id']}"
+        raise ValueError(f"Unsupported action: {action}")
+
     def _run_ssh(self, command: str):
         if not self.ssh_client:
             raise RuntimeError("SSH connection not established")
         stdin, stdout, stderr = self.ssh_client.exec_command(command)
-        return stdout.read().decode(), stderr.read().decode()
+        # Сырые байты: декодируем только там, где текст действительно нужен.
+        return stdout.read(), stderr.read()
 
     def run_ssh_command(self, command: str) -> str:
         output, error = self._run_ssh(command)
         if error:
-            raise RuntimeError(error)
-        return output
-
-    # ------------------------------------------------------------------
-    # PARSING (minimal, safe)
-    # ------------------------------------------------------------------
-
-    def _parse_print(self, output: str) -> List[Dict]:
-        """
-        Минимальный парсер print-вывода.
-        Для fallback-режима.
-        """
-        items = []
-        for line in output.splitlines():
-            if "=" not in line:
-                continue
-            entry = {}
-            for part in line.split():
-                if "=" in part:
-                    k, v = part.split("=", 1)
-                    entry[k] = v
-            if entry:
-                items.append(entry)
-        return items
-
-    # ------------------------------------------------------------------
-    # FILE OPERATIONS (SSH ONLY)
-    # ------------------------------------------------------------------
-
-    def upload_file(self, local_path: str, remote_path: str):
-        if not self.sftp_client:
-            raise RuntimeError("SFTP not connected")
-        if not os.path.isfile(local_path):
-            raise FileNotFoundError(local_path)
-        self.sftp_client.put(local_path, remote_path)
-
-    def download_file(self, remote_path: str, local_path: str):
-        if not self.sftp_client:
-            raise RuntimeError("SFTP not connected")
-        self.sftp_client.get(remote_path, local_path)
+            raise RuntimeError(error.decode())
+        return output.decode()
+
+    # ------------------------------------------------------------------
+    # PARSING (minimal, safe)
+    # ------------------------------------------------------------------
+
+    def _parse_print(self, output: bytes) -> List[Dict]:
+        """
+        Минимальный парсер print-вывода.
+        Для fallback-режима.
+        """
+        items = []
+        for line in output.splitlines():
+            entry = {
+                match.group(1).decode(): match.group(2).decode().strip('"')
+                for match in _KV_RE.finditer(line)
+            }
+            if entry:
+                items.append(entry)
+        return items
+
+    # ------------------------------------------------------------------
+    # FILE OPERATIONS (SSH ONLY)
+    # ------------------------------------------------------------------
+
+    def upload_file(self, local_path: str, remote_path: str):
+        if not self.sftp_client:
+            raise RuntimeError("SFTP not connected")
+        if not os.path.isfile(local_path):
+            raise FileNotFoundError(local_path)
+        # Потоковая загрузка через putfo с крупным буфером: файл не читается
+        # в память целиком, а известный file_size избавляет от финального stat.
+        file_size = os.path.getsize(local_path)
+        with open(local_path, "rb", buffering=1 << 20) as local_file:
+            self.sftp_client.putfo(local_file, remote_path, file_size=file_size)
+
+    def download_file(self, remote_path: str, local_path: str):
+        if not self.sftp_client:
+            raise RuntimeError("SFTP not connected")
+        # prefetch() конвейеризирует SFTP READ-запросы (десятки одновременно),
+        # так что скачивание упирается в пропускную способность, а не в RTT
+        # последовательных запросов чтения.
+        # Пишем сразу в конечный storage_path: промежуточного temp-файла нет,
+        # поэтому локальное копирование (и os.sendfile для него) не требуется.
+        # sendfile задействуется на отдаче файла клиенту через FileResponse.
+        with self.sftp_client.open(remote_path, "rb") as remote_file:
+            file_size = remote_file.stat().st_size
+            remote_file.prefetch(file_size)
+            with open(local_path, "wb") as local_file:
+                shutil.copyfileobj(remote_file, local_file, length=1 << 20)
@@ -1,10 +1,25 @@
 import asyncio
+import contextlib
 import os
-from typing import Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
 
 _MAX_PARALLEL_CONNECTIONS = int(os.getenv("MIKROTIK_MAX_PARALLEL_CONNECTIONS", "10"))
 _connection_semaphore: Optional[asyncio.Semaphore] = None
 
+# Выделенный пул потоков для блокирующих вызовов librouteros/paramiko:
+# дефолтный executor event loop-а ограничен min(32, cpu+4) потоками и делится
+# со всем приложением, что ставит RouterOS-вызовы в общую очередь.
+_io_executor = ThreadPoolExecutor(
+    max_workers=_MAX_PARALLEL_CONNECTIONS * 2,
+    thread_name_prefix="mikrotik-io",
+)
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    return _io_executor
+
 
 def _get_connection_semaphore() -> asyncio.Semaphore:
     global _connection_semaphore
@@ -23,3 +38,102 @@ def release_connection_slot() -> None:
 
 def get_parallel_connection_limit() -> int:
     return _MAX_PARALLEL_CONNECTIONS
+
+
+# Пул живых коннекторов по device_id: TCP/TLS handshake и RouterOS-логин
+# оплачиваются один раз, последовательные операции переиспользуют сессию.
+# Слот _connection_semaphore занят только на время операции: при парковке
+# коннектора в пул слот возвращается и занимается заново при выдаче, так что
+# простаивающий пул не ограничивает параллельные подключения к другим
+# устройствам.
+_POOL_IDLE_TIMEOUT = float(os.getenv("MIKROTIK_POOL_IDLE_TIMEOUT", "60"))
+
+
+class ConnectorPool:
+    """Пул MikroTikConnector с идл-эвикцией.
+
+    acquire() выдает коннектор эксклюзивно (lock на устройство): сессия
+    librouteros не рассчитана на конкурентные команды. При ошибке внутри
+    блока коннектор отключается и пересоздается при следующем обращении.
+    """
+
+    def __init__(self, idle_timeout: float = _POOL_IDLE_TIMEOUT):
+        self._idle_timeout = idle_timeout
+        self._pool: Dict[int, "object"] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._last_used: Dict[int, float] = {}
+        self._evictor: Optional[asyncio.Task] = None
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, device_id: int, factory: Callable):
+        lock = self._locks.setdefault(device_id, asyncio.Lock())
+        async with lock:
+            connector = self._pool.get(device_id)
+            if connector is None or (
+                not connector.api_connection and not connector.ssh_client
+            ):
+                connector = factory()
+                await connector.connect()
+                self._pool[device_id] = connector
+            else:
+                # Слот лимита был возвращен при парковке — занимаем заново.
+                await connector.hold_connection_slot()
+            try:
+                yield connector
+            except Exception:
+                # Сессия могла остаться в неопределенном состоянии — не
+                # возвращаем ее в пул, следующий вызов подключится заново.
+                self._pool.pop(device_id, None)
+                await connector.disconnect()
+                raise
+            else:
+                # Коннектор остается живым в пуле, но слот отдаем: лимит
+                # считает активные операции, а не припаркованные сессии.
+                connector.yield_connection_slot()
+            finally:
+                self._last_used[device_id] = time.monotonic()
+        self._ensure_evictor()
+
+    def invalidate(self, device_id: int) -> None:
+        """Убрать коннектор из пула (например, при смене учетных данных)."""
+        connector = self._pool.pop(device_id, None)
+        if connector is not None:
+            asyncio.ensure_future(connector.disconnect())
+
+    def _ensure_evictor(self) -> None:
+        if self._evictor is None or self._evictor.done():
+            self._evictor = asyncio.ensure_future(self._evict_idle())
+
+    async def _evict_idle(self) -> None:
+        while self._pool:
+            await asyncio.sleep(self._idle_timeout / 2)
+            deadline = time.monotonic() - self._idle_timeout
+            for device_id in list(self._pool):
+                lock = self._locks.setdefault(device_id, asyncio.Lock())
+                if lock.locked() or self._last_used.get(device_id, 0) > deadline:
+                    continue
+                async with lock:
+                    connector = self._pool.pop(device_id, None)
+                    if connector is not None:
+                        await connector.disconnect()
+
+    async def close_all(self) -> None:
+        """Отключить все коннекторы (shutdown-хук приложения).
+
+        Сбрасывает и per-device lock-и: asyncio.Lock привязывается к loop-у
+        первого использования, а celery-воркер создает новый event loop на
+        каждое выполнение задачи — без сброса пул нельзя переиспользовать
+        в следующем loop-е.
+        """
+        if self._evictor is not None:
+            self._evictor.cancel()
+            self._evictor = None
+        for device_id in list(self._pool):
+            connector = self._pool.pop(device_id, None)
+            if connector is not None:
+                await connector.disconnect()
+        self._locks.clear()
+        self._last_used.clear()
+
+
+connector_pool = ConnectorPool()
@@ -17,6 +17,13 @@ from typing import List, Optional, Tuple
 from cryptography.fernet import Fernet, InvalidToken
 
 FERNET_PREFIX = "fernet:v1:"
+# v2: в префикс встроен индекс ключа ("fernet:v2:<idx>:<token>") — дешифровка
+# идет сразу нужным ключом (O(1)) вместо перебора всех ключей ротации с
+# HMAC-проверкой на каждом (O(K)).
+FERNET_V2_PREFIX = "fernet:v2:"
+# Длины префиксов считаются один раз на импорт, а не len() на каждый вызов.
+_FERNET_PREFIX_LEN = len(FERNET_PREFIX)
+_FERNET_V2_PREFIX_LEN = len(FERNET_V2_PREFIX)
 LEGACY_MODE_ENV = "DEVICE_PASSWORD_LEGACY_MODE"
 KEYS_ENV = "DEVICE_PASSWORD_KEYS"
 KEY_ENV = "DEVICE_PASSWORD_KEY"
@@ -96,14 +103,39 @@ def encrypt_password(password: str) -> str:
         return ""
     primary = _require_fernets()[0]
     token = primary.encrypt(password.encode("utf-8")).decode("utf-8")
-    return f"{FERNET_PREFIX}{token}"
+    return f"{FERNET_V2_PREFIX}0:{token}"
 
 
+# Кэш по сырому значению из БД: Fernet-дешифровка (HMAC-verify + AES) —
+# это CPU-работа на каждый вызов, а ciphertext детерминированно отображается
+# в plaintext. При ротации ключей процесс перезапускается, так что
+# устаревание кэша не проблема.
+@lru_cache(maxsize=4096)
 def decrypt_password_with_migration(password: str) -> Tuple[str, Optional[str]]:
     if not password:
         return "", None
+    if password.startswith(FERNET_V2_PREFIX):
+        index_str, _, token_str = password[_FERNET_V2_PREFIX_LEN:].partition(":")
+        token = token_str.encode("utf-8")
+        fernets = _require_fernets()
+        try:
+            index = int(index_str)
+        except ValueError:
+            index = -1
+        if 0 <= index < len(fernets):
+            try:
+                plaintext = fernets[index].decrypt(token).decode("utf-8")
+                if index == 0:
+                    return plaintext, None
+                return plaintext, encrypt_password(plaintext)
+            except InvalidToken:
+                pass
+        # Ротация сдвинула индексы — находим ключ перебором и перешифровываем
+        # значение с актуальным маркером.
+        plaintext, _ = _decrypt_with_fernets(token)
+        return plaintext, encrypt_password(plaintext)
     if password.startswith(FERNET_PREFIX):
-        token = password[len(FERNET_PREFIX):].encode("utf-8")
+        token = password[_FERNET_PREFIX_LEN:].encode("utf-8")
         plaintext, index = _decrypt_with_fernets(token)
         if index == 0:
             return plaintext, None
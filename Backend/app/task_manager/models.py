@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Index, Integer, String, Boolean, DateTime, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from db import Base
@@ -7,6 +7,11 @@ from db import Base
 class Task(Base):
     """Запланированная задача для устройств/групп."""
     __tablename__ = "tasks"
+    # Диспетчер каждую минуту выбирает задачи по (is_enabled, next_run_at) —
+    # составной индекс превращает этот тик из полного скана таблицы в range-поиск.
+    __table_args__ = (
+        Index("ix_tasks_enabled_next_run", "is_enabled", "next_run_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(150), nullable=False)
@@ -1,9 +1,12 @@
 import asyncio
+import logging
 import os
 from typing import Optional
 
 from task_manager.worker import dispatch_scheduled_tasks
 
+logger = logging.getLogger(__name__)
+
 
 class TaskScheduler:
     def __init__(self, interval_seconds: int = 60):
@@ -24,7 +27,13 @@ class TaskScheduler:
 
     async def _run_loop(self) -> None:
         while not self._stop_event.is_set():
-            dispatch_scheduled_tasks()
+            # Диспетчер ходит в БД блокирующим ORM — уводим тик в поток,
+            # чтобы event loop (и HTTP-запросы на нем) не замирал на время
+            # SQL. Ошибка тика логируется, а не убивает цикл планировщика.
+            try:
+                await asyncio.to_thread(dispatch_scheduled_tasks)
+            except Exception:
+                logger.exception("Scheduler tick failed")
             try:
                 await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval_seconds)
             except asyncio.TimeoutError:
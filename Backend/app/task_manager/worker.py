@@ -1,11 +1,15 @@
 import asyncio
-import json
+import os
+import threading
 import uuid
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 
+import orjson
 from celery.utils.log import get_task_logger
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session, selectinload
 
 from backup_manager.service import BackupService
 from db import SessionLocal
@@ -14,17 +18,49 @@ from device_manager.service import DeviceService
 from firewall_manager.schemas import FirewallListType
 from firewall_manager.service import FirewallListService
 from mikrotik_connector import MikroTikConnector
+from mikrotik_connector.utils import connector_pool
 from task_manager.celery_app import celery_app
 from task_manager.models import Task, TaskExecution, TaskResult, TaskTarget
 
 logger = get_task_logger(__name__)
 
-
-def _parse_cron_field(value: str, minimum: int, maximum: int) -> List[int]:
-    # Разбирает одно cron-поле в набор числовых значений, поддерживая "*",
-    # шаги (*/n), диапазоны (a-b) и списки, разделенные запятыми.
+# Предел одновременных устройств внутри одного выполнения задачи: I/O к
+# MikroTik сетевой, gather масштабируется линейно, но лимит соединений
+# устройств/воркера выбивать не стоит.
+_TASK_DEVICE_CONCURRENCY = int(os.getenv("TASK_DEVICE_CONCURRENCY", "8"))
+
+# Постоянный фоновый event loop процесса-воркера: asyncio.run на каждую
+# задачу создавал и разрушал loop вместе с selector-ом и default executor-ом.
+# Живущий loop заодно позволяет пулу коннекторов переживать границы задач
+# (до worker_max_tasks_per_child). Создается лениво — после fork-а prefork-
+# воркера, в его собственном процессе.
+_worker_loop_lock = threading.Lock()
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _run_async(coro):
+    global _worker_loop
+    with _worker_loop_lock:
+        if _worker_loop is None or _worker_loop.is_closed():
+            _worker_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_worker_loop.run_forever,
+                name="task-worker-loop",
+                daemon=True,
+            ).start()
+        loop = _worker_loop
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+@lru_cache(maxsize=512)
+def _parse_cron_field(value: str, minimum: int, maximum: int) -> int:
+    # Разбирает одно cron-поле в битовую маску допустимых значений (бит N
+    # установлен, если значение N разрешено), поддерживая "*", шаги (*/n),
+    # диапазоны (a-b) и списки через запятую. Результат мемоизируется:
+    # расписаний мало, а compute_next_run опрашивает до 1440 минут —
+    # без кэша одно и то же поле парсилось бы тысячи раз.
     if value == "*":
-        return list(range(minimum, maximum + 1))
+        return ((1 << (maximum - minimum + 1)) - 1) << minimum
 
     values: List[int] = []
     for part in value.split(","):
@@ -37,25 +73,38 @@ def _parse_cron_field(value: str, minimum: int, maximum: int) -> List[int]:
             values.extend(range(int(start), int(end) + 1))
         else:
             values.append(int(part))
-    return sorted({v for v in values if minimum <= v <= maximum})
 
+    mask = 0
+    for v in values:
+        if minimum <= v <= maximum:
+            mask |= 1 << v
+    return mask
 
-def cron_matches(dt: datetime, expression: str) -> bool:
-    # Сопоставляет дату-время со всеми пятью cron-полями, раскрывая каждое поле
-    # в допустимый набор значений и проверяя вхождение.
-    minute_s, hour_s, day_s, month_s, weekday_s = expression.split()
-    minutes = _parse_cron_field(minute_s, 0, 59)
-    hours = _parse_cron_field(hour_s, 0, 23)
-    days = _parse_cron_field(day_s, 1, 31)
-    months = _parse_cron_field(month_s, 1, 12)
-    weekdays = _parse_cron_field(weekday_s, 0, 6)
 
+@lru_cache(maxsize=512)
+def _parse_cron_expression(expression: str) -> tuple:
+    # Пять полей выражения, развернутые в битовые маски.
+    minute_s, hour_s, day_s, month_s, weekday_s = expression.split()
     return (
-        dt.minute in minutes
-        and dt.hour in hours
-        and dt.day in days
-        and dt.month in months
-        and dt.weekday() in weekdays
+        _parse_cron_field(minute_s, 0, 59),
+        _parse_cron_field(hour_s, 0, 23),
+        _parse_cron_field(day_s, 1, 31),
+        _parse_cron_field(month_s, 1, 12),
+        _parse_cron_field(weekday_s, 0, 6),
+    )
+
+
+def cron_matches(dt: datetime, expression: str) -> bool:
+    # Пять сдвигов + AND над предразобранными масками — без построения
+    # коллекций и хэш-поисков на каждый вызов.
+    minutes, hours, days, months, weekdays = _parse_cron_expression(expression)
+    return bool(
+        (minutes >> dt.minute)
+        & (hours >> dt.hour)
+        & (days >> dt.day)
+        & (months >> dt.month)
+        & (weekdays >> dt.weekday())
+        & 1
     )
 
 
@@ -72,18 +121,24 @@ def compute_next_run(now: datetime, expression: str, lookahead_minutes: int = 60
 
 def _collect_target_device_ids(session: Session, task: Task) -> List[int]:
     # Преобразует цели задачи в уникальный отсортированный список ID устройств,
-    # разворачивая группы в список входящих в них устройств.
+    # разворачивая группы в список входящих в них устройств. Все группы
+    # разворачиваются одним IN-запросом по колонке id вместо отдельного
+    # SELECT полных строк Device на каждую цель.
     device_ids: List[int] = []
+    group_ids: List[int] = []
     for target in task.targets:
         if target.target_type == "device" and target.device_id:
             device_ids.append(target.device_id)
         elif target.target_type == "group" and target.group_id:
-            group_devices = (
-                session.query(Device)
-                .filter(Device.group_id == target.group_id)
-                .all()
-            )
-            device_ids.extend([device.id for device in group_devices])
+            group_ids.append(target.group_id)
+
+    if group_ids:
+        rows = (
+            session.query(Device.id)
+            .filter(Device.group_id.in_(group_ids))
+            .all()
+        )
+        device_ids.extend(row[0] for row in rows)
     return sorted(set(device_ids))
 
 
@@ -91,8 +146,8 @@ def _load_task_payload(task: Task) -> Dict[str, Any]:
     if not task.payload:
         return {}
     try:
-        return json.loads(task.payload)
-    except json.JSONDecodeError as exc:
+        return orjson.loads(task.payload)
+    except orjson.JSONDecodeError as exc:
         raise ValueError("Invalid task payload JSON") from exc
 
 
@@ -126,78 +181,73 @@ def _normalize_firewall_list_type(list_type_raw: Optional[str]) -> FirewallListT
     raise ValueError(f"Unsupported firewall list type: {list_type_raw}")
 
 
+# Таблица экранирования для RouterOS-скриптов: один C-проход str.translate
+# вместо двух цепочных .replace с промежуточной копией строки на каждый.
+_ROS_ESCAPE_TABLE = str.maketrans({"\\": "\\\\", "\"": "\\\""})
+
+
 def _escape_routeros_script(script: str) -> str:
-    return script.replace("\\", "\\\\").replace("\"", "\\\"")
+    return script.translate(_ROS_ESCAPE_TABLE)
 
 
 async def _execute_script_task(connector: MikroTikConnector, payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Коннектор приходит уже подключенным из пула; жизненным циклом
+    # соединения управляет connector_pool.
     script = payload.get("script")
     script_name = payload.get("script_name")
     if not script and not script_name:
         raise ValueError("Missing script or script_name for script execution")
 
-    await connector.connect()
-    try:
-        if not connector.ssh_client:
-            raise RuntimeError("SSH connection required for script execution")
-
-        if script_name:
-            output = connector.run_ssh_command(f"/system/script/run {script_name}")
-            return {"script_name": script_name, "output": output}
-
-        escaped_script = _escape_routeros_script(script)
-        task_script_name = f"task_script_{uuid.uuid4().hex[:10]}"
-        created = False
-        connector.run_ssh_command(
-            f"/system/script/add name=\"{task_script_name}\" source=\"{escaped_script}\""
-        )
-        created = True
-        try:
-            output = connector.run_ssh_command(f"/system/script/run {task_script_name}")
-        finally:
-            if created:
-                connector.run_ssh_command(
-                    f"/system/script/remove [find name=\"{task_script_name}\"]"
-                )
-        return {"script_name": task_script_name, "output": output}
-    finally:
-        await connector.disconnect()
+    if not connector.ssh_client:
+        raise RuntimeError("SSH connection required for script execution")
 
+    if script_name:
+        output = connector.run_ssh_command(f"/system/script/run {script_name}")
+        return {"script_name": script_name, "output": output}
 
-async def _execute_reboot_task(connector: MikroTikConnector) -> Dict[str, Any]:
-    await connector.connect()
+    escaped_script = _escape_routeros_script(script)
+    task_script_name = f"task_script_{uuid.uuid4().hex[:10]}"
+    created = False
+    connector.run_ssh_command(
+        f"/system/script/add name=\"{task_script_name}\" source=\"{escaped_script}\""
+    )
+    created = True
     try:
-        if not connector.ssh_client:
-            raise RuntimeError("SSH connection required for reboot")
-        output = connector.run_ssh_command("/system/reboot")
-        return {"command": "/system/reboot", "output": output}
+        output = connector.run_ssh_command(f"/system/script/run {task_script_name}")
     finally:
-        await connector.disconnect()
+        if created:
+            connector.run_ssh_command(
+                f"/system/script/remove [find name=\"{task_script_name}\"]"
+            )
+    return {"script_name": task_script_name, "output": output}
 
 
-async def _execute_reset_task(connector: MikroTikConnector, payload: Dict[str, Any]) -> Dict[str, Any]:
-    await connector.connect()
-    try:
-        if not connector.ssh_client:
-            raise RuntimeError("SSH connection required for reset")
-        options = payload.get("options", {}) if isinstance(payload.get("options", {}), dict) else {}
-        args: List[str] = []
-        if "keep_users" in options:
-            args.append(f"keep-users={'yes' if options['keep_users'] else 'no'}")
-        if "no_defaults" in options:
-            args.append(f"no-defaults={'yes' if options['no_defaults'] else 'no'}")
-        if "skip_backup" in options:
-            args.append(f"skip-backup={'yes' if options['skip_backup'] else 'no'}")
-        command = "/system/reset-configuration"
-        if args:
-            command = f"{command} {' '.join(args)}"
-        output = connector.run_ssh_command(command)
-        return {"command": command, "output": output}
-    finally:
-        await connector.disconnect()
+async def _execute_reboot_task(connector: MikroTikConnector) -> Dict[str, Any]:
+    if not connector.ssh_client:
+        raise RuntimeError("SSH connection required for reboot")
+    output = connector.run_ssh_command("/system/reboot")
+    return {"command": "/system/reboot", "output": output}
 
 
-def _execute_task_for_device(session: Session, task: Task, device_id: int) -> Dict[str, Any]:
+async def _execute_reset_task(connector: MikroTikConnector, payload: Dict[str, Any]) -> Dict[str, Any]:
+    if not connector.ssh_client:
+        raise RuntimeError("SSH connection required for reset")
+    options = payload.get("options", {}) if isinstance(payload.get("options", {}), dict) else {}
+    args: List[str] = []
+    if "keep_users" in options:
+        args.append(f"keep-users={'yes' if options['keep_users'] else 'no'}")
+    if "no_defaults" in options:
+        args.append(f"no-defaults={'yes' if options['no_defaults'] else 'no'}")
+    if "skip_backup" in options:
+        args.append(f"skip-backup={'yes' if options['skip_backup'] else 'no'}")
+    command = "/system/reset-configuration"
+    if args:
+        command = f"{command} {' '.join(args)}"
+    output = connector.run_ssh_command(command)
+    return {"command": command, "output": output}
+
+
+async def _execute_task_for_device(session: Session, task: Task, device_id: int) -> Dict[str, Any]:
     payload = _load_task_payload(task)
     base_payload = {
         "task_type": task.task_type,
@@ -206,16 +256,20 @@ def _execute_task_for_device(session: Session, task: Task, device_id: int) -> Di
     }
     if task.task_type == "check_availability":
         service = DeviceService(session)
-        status = asyncio.run(service.check_device_availability(device_id))
+        status = await service.check_device_availability(device_id)
         return {
             **base_payload,
-            "result": {"status": status.dict() if status else {"error": "device_not_found"}},
+            "result": {"status": status.model_dump() if status else {"error": "device_not_found"}},
         }
 
     if task.task_type in {"execute_script", "script_execution"}:
         device_data = _get_device_credentials(session, device_id)
-        connector = _build_connector(device_data)
-        result = asyncio.run(_execute_script_task(connector, payload))
+        # Коннектор из пула: SSH-handshake амортизируется по всем
+        # sub-операциям задачи на одном устройстве.
+        async with connector_pool.acquire(
+            device_id, lambda: _build_connector(device_data)
+        ) as connector:
+            result = await _execute_script_task(connector, payload)
         return {**base_payload, "result": {"script_execution": result}}
 
     if task.task_type == "firewall_list_update":
@@ -228,17 +282,17 @@ def _execute_task_for_device(session: Session, task: Task, device_id: int) -> Di
 
         service = FirewallListService(DeviceService(session))
         if operation == "add":
-            response = asyncio.run(service.add_address(device_id, list_type, address, comment))
+            response = await service.add_address(device_id, list_type, address, comment)
         elif operation == "remove":
-            response = asyncio.run(service.remove_address(device_id, list_type, address))
+            response = await service.remove_address(device_id, list_type, address)
         else:
             raise ValueError(f"Unsupported firewall operation: {operation}")
-        return {**base_payload, "result": {"firewall_list_update": response.dict()}}
+        return {**base_payload, "result": {"firewall_list_update": response.model_dump()}}
 
     if task.task_type == "backup_creation":
         backup_type = payload.get("backup_type", "backup")
         service = BackupService(session)
-        records = asyncio.run(service.run_backup_bundle(device_id, backup_type))
+        records = await service.run_backup_bundle(device_id, backup_type)
         record_payload = [
             {
                 "id": record.id,
@@ -253,70 +307,131 @@ def _execute_task_for_device(session: Session, task: Task, device_id: int) -> Di
 
     if task.task_type == "reboot":
         device_data = _get_device_credentials(session, device_id)
-        connector = _build_connector(device_data)
-        result = asyncio.run(_execute_reboot_task(connector))
+        async with connector_pool.acquire(
+            device_id, lambda: _build_connector(device_data)
+        ) as connector:
+            result = await _execute_reboot_task(connector)
+        # Устройство уходит в перезагрузку — пуловое соединение мертво.
+        connector_pool.invalidate(device_id)
         return {**base_payload, "result": {"reboot": result}}
 
     if task.task_type == "reset":
         device_data = _get_device_credentials(session, device_id)
-        connector = _build_connector(device_data)
-        result = asyncio.run(_execute_reset_task(connector, payload))
+        async with connector_pool.acquire(
+            device_id, lambda: _build_connector(device_data)
+        ) as connector:
+            result = await _execute_reset_task(connector, payload)
+        connector_pool.invalidate(device_id)
         return {**base_payload, "result": {"reset": result}}
 
     raise ValueError(f"Unsupported task type: {task.task_type}")
 
 
+async def _execute_task_for_devices(
+    session: Session, task: Task, device_ids: List[int]
+) -> List:
+    # Один event loop на все устройства задачи: asyncio.run на каждое
+    # устройство создавал и разрушал loop (вместе с thread pool) по разу
+    # на цель и исключал параллелизм. Семафор ограничивает одновременные
+    # подключения; исключения возвращаются поэлементно.
+    semaphore = asyncio.Semaphore(_TASK_DEVICE_CONCURRENCY)
+
+    async def _bounded(device_id: int):
+        async with semaphore:
+            return await _execute_task_for_device(session, task, device_id)
+
+    # Пул коннекторов не дренируется: фоновый loop живет между задачами,
+    # так что соединения переиспользуются, а простаивающие закрывает
+    # evictor пула.
+    return await asyncio.gather(
+        *(_bounded(device_id) for device_id in device_ids),
+        return_exceptions=True,
+    )
+
+
 @celery_app.task(name="task_manager.worker.execute_task", bind=True)
 def execute_task(self, task_id: int, triggered_by: str = "schedule") -> None:
     # Выполняет задачу по целевым устройствам, фиксирует результаты по каждому
     # устройству и обновляет метаданные выполнения на основе успеха/ошибок.
     session = SessionLocal()
     try:
-        task = session.query(Task).filter(Task.id == task_id).first()
+        task = (
+            session.query(Task)
+            .options(selectinload(Task.targets))
+            .filter(Task.id == task_id)
+            .first()
+        )
         if not task or not task.is_enabled:
             logger.warning("Task %s not found or disabled", task_id)
             return
 
         execution = TaskExecution(task_id=task.id, status="running", triggered_by=triggered_by)
         session.add(execution)
-        session.commit()
-        session.refresh(execution)
+        # flush отдает execution.id тем же INSERT-ом — отдельный commit и
+        # refresh (лишний SELECT) не нужны; вся инициализация запуска
+        # фиксируется одним commit-ом ниже вместе со строками результатов.
+        session.flush()
 
         device_ids = _collect_target_device_ids(session, task)
-        results: List[TaskResult] = []
-
-        for device_id in device_ids:
-            result = TaskResult(
-                execution_id=execution.id,
-                device_id=device_id,
-                status="running",
-                started_at=datetime.now(timezone.utc),
-            )
-            session.add(result)
-            results.append(result)
+
+        # Строки результатов создаются одним bulk-insert-ом (вместо N
+        # отдельных INSERT через unit-of-work); return_defaults=True
+        # возвращает сгенерированные PK для последующего bulk-update.
+        started_at = datetime.now(timezone.utc)
+        result_rows: List[Dict[str, Any]] = [
+            {
+                "execution_id": execution.id,
+                "device_id": device_id,
+                "status": "running",
+                "started_at": started_at,
+            }
+            for device_id in device_ids
+        ]
+        session.bulk_insert_mappings(TaskResult, result_rows, return_defaults=True)
         session.commit()
 
         failures = 0
-        for result in results:
-            try:
-                payload = _execute_task_for_device(session, task, result.device_id)
-                result.status = "success"
-                result.result_payload = json.dumps(payload, ensure_ascii=False)
-                result.output = json.dumps(payload, ensure_ascii=False)
-            except Exception as exc:
+        outcomes = _run_async(
+            _execute_task_for_devices(session, task, device_ids)
+        )
+        # Фан-аут по устройствам натаскивает в identity map сессии ORM-
+        # объекты вложенных сервисов (Device, Backup и т.д.) — сбрасываем
+        # их, чтобы память задачи не росла с числом устройств. task и
+        # execution дозагрузят просроченные атрибуты одним SELECT-ом.
+        session.expire_all()
+        finished_at = datetime.now(timezone.utc)
+        updates: List[Dict[str, Any]] = []
+        for row, outcome in zip(result_rows, outcomes):
+            if isinstance(outcome, BaseException):
                 failures += 1
-                result.status = "failed"
-                result.error_message = str(exc)
-                error_payload = {"error": str(exc), "task_type": task.task_type}
-                result.result_payload = json.dumps(error_payload, ensure_ascii=False)
-                result.output = json.dumps(error_payload, ensure_ascii=False)
-            result.finished_at = datetime.now(timezone.utc)
-            session.add(result)
-        session.commit()
+                status_value = "failed"
+                error_message = str(outcome)
+                error_payload = {"error": error_message, "task_type": task.task_type}
+                serialized = orjson.dumps(error_payload).decode("utf-8")
+            else:
+                status_value = "success"
+                error_message = None
+                # orjson сериализует на порядок быстрее stdlib и заодно
+                # понимает datetime; дампим один раз на оба столбца.
+                serialized = orjson.dumps(outcome).decode("utf-8")
+            updates.append(
+                {
+                    "id": row["id"],
+                    "status": status_value,
+                    "error_message": error_message,
+                    "result_payload": serialized,
+                    "output": serialized,
+                    "finished_at": finished_at,
+                }
+            )
+        if updates:
+            session.bulk_update_mappings(TaskResult, updates)
 
+        # Итоги выполнения и расписание фиксируются тем же commit-ом,
+        # что и bulk-update результатов.
         execution.status = "failed" if failures else "success"
-        execution.finished_at = datetime.now(timezone.utc)
-        task.last_run_at = datetime.now(timezone.utc)
+        execution.finished_at = finished_at
+        task.last_run_at = finished_at
         task.next_run_at = compute_next_run(task.last_run_at, task.schedule_expression)
         session.add_all([execution, task])
         session.commit()
@@ -326,26 +441,47 @@ def execute_task(self, task_id: int, triggered_by: str = "schedule") -> None:
 
 @celery_app.task(name="task_manager.worker.dispatch_scheduled_tasks")
 def dispatch_scheduled_tasks() -> None:
-    # Обходит включенные задачи, рассчитывает отсутствующие расписания и ставит
-    # в очередь те, чей next_run_at наступил и совпадает с cron-выражением.
+    # Выбирает из БД только задачи, чей срок наступил (или расписание еще
+    # не рассчитано) — фильтр по next_run_at уходит в SQL под составной
+    # индекс (is_enabled, next_run_at), вместо скана всех включенных задач
+    # в Python. Запрашиваются только нужные колонки, без материализации
+    # ORM-объектов; обновления расписаний уходят UPDATE-ами и фиксируются
+    # одним commit-ом в конце обхода.
     session = SessionLocal()
     now = datetime.now(timezone.utc)
     try:
-        tasks: Iterable[Task] = session.query(Task).filter(Task.is_enabled.is_(True)).all()
-        for task in tasks:
-            next_run = task.next_run_at
+        candidates = (
+            session.query(Task.id, Task.schedule_expression, Task.next_run_at)
+            .filter(
+                Task.is_enabled.is_(True),
+                or_(Task.next_run_at.is_(None), Task.next_run_at <= now),
+            )
+            .all()
+        )
+        dirty = False
+        for task_id, expression, next_run in candidates:
             if not next_run:
-                task.next_run_at = compute_next_run(now, task.schedule_expression)
-                session.add(task)
-                session.commit()
+                session.execute(
+                    update(Task)
+                    .where(Task.id == task_id)
+                    .values(next_run_at=compute_next_run(now, expression))
+                )
+                dirty = True
                 continue
 
-            if next_run <= now and cron_matches(now, task.schedule_expression):
-                logger.info("Dispatching task %s", task.id)
-                execute_task.delay(task.id, "schedule")
-                task.last_run_at = now
-                task.next_run_at = compute_next_run(now, task.schedule_expression)
-                session.add(task)
-                session.commit()
+            if cron_matches(now, expression):
+                logger.info("Dispatching task %s", task_id)
+                execute_task.delay(task_id, "schedule")
+                session.execute(
+                    update(Task)
+                    .where(Task.id == task_id)
+                    .values(
+                        last_run_at=now,
+                        next_run_at=compute_next_run(now, expression),
+                    )
+                )
+                dirty = True
+        if dirty:
+            session.commit()
     finally:
         session.close()
@@ -0,0 +1,49 @@
+"""Add hot-path indexes for backup_records and devices
+
+Revision ID: 9f2c41a7d3b8
+Revises:
+Create Date: 2026-08-28 12:00:00.000000
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9f2c41a7d3b8"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции, поэтому
+    # создаем индексы в autocommit-блоке; на не-PostgreSQL флаг игнорируется.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_backup_records_device_created",
+            "backup_records",
+            ["device_id", "created_at"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_devices_group",
+            "devices",
+            ["group_id"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_backup_records_device_id", table_name="backup_records")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_backup_records_device_id",
+            "backup_records",
+            ["device_id"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_devices_group", table_name="devices")
+        op.drop_index("ix_backup_records_device_created", table_name="backup_records")
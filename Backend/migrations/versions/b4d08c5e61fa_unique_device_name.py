@@ -0,0 +1,30 @@
+"""Enforce unique device names
+
+Revision ID: b4d08c5e61fa
+Revises: 9f2c41a7d3b8
+Create Date: 2026-08-28 12:30:00.000000
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b4d08c5e61fa"
+down_revision = "9f2c41a7d3b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Уникальность имени нужна для INSERT ... ON CONFLICT в create_device.
+    # Уникальный индекс вместо constraint-а: ALTER TABLE ... ADD CONSTRAINT
+    # не поддерживается SQLite, а как цель ON CONFLICT индекс равнозначен
+    # на обоих бэкендах.
+    op.create_index("uq_devices_name", "devices", ["name"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("uq_devices_name", table_name="devices")
